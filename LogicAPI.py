@@ -1,15 +1,37 @@
-from collections import OrderedDict, defaultdict
+from collections import Counter, OrderedDict, defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import asyncio
+import bisect
+import csv
+import io
+import itertools
+import json
+import multiprocessing
 import operator
 import numbers
+import os
+import pickle
+import struct
+import tempfile
+import threading
+import time
+import weakref
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 NoneType = type(None)
 
-kb = OrderedDict()
 supportedConstTypes = set()
 supportedConstTypes.add(NoneType)
 supportedConstTypes.add(numbers.Number)
 supportedConstTypes.add(str)
 supportedConstTypes.add(bool)
+internedTypes = (NoneType, bool, str)
+internedInts = 1024
+internGroundTerms = True
 
 
 def fromPythonArg(arg):
@@ -21,7 +43,6 @@ def fromPythonArg(arg):
     elif isinstance(arg, AnonVar):
         return IntVar()
     elif isinstance(arg, Var):
-        arg.rank = 0
         return arg
     elif isinstance(arg, Term) or isinstance(arg, List) or isinstance(arg, Const):
         return arg
@@ -32,26 +53,27 @@ def fromPythonArg(arg):
         raise Exception("Unsupported constant type of " + repr(arg))
 
 
-class Term(object):
+class TermType(type):
+    def __new__(mcs, name, bases, namespace):
+        if '__slots__' not in namespace and '__init__' not in namespace:
+            namespace['__slots__'] = ()
+        return type.__new__(mcs, name, bases, namespace)
+
+
+class Term(object, metaclass=TermType):
+    __slots__ = ('functor', 'args', 'ground', '__weakref__')
+    tabled = False
+
     def __init__(self, *args):
         self.functor = self.__class__
         self.args = [fromPythonArg(arg) for arg in args]
+        self.ground = all(arg.ground for arg in self.args)
 
     def __le__(self, other):
-        if isinstance(other, Term):
-            other = Terms(other)
-        key = (self.functor, len(self.args))
-        if key in kb:
-            kb[key].append((self, other))
-        else:
-            kb[key] = [(self, other)]
+        addClause(self, other)
 
     def __pos__(self):
-        key = (self.functor, len(self.args))
-        if key in kb:
-            kb[key].append((self, Terms()))
-        else:
-            kb[key] = [(self, Terms())]
+        addClause(self, None)
 
     def __repr__(self):
         return self.functor.__name__ + '(' + ','.join([repr(arg) for arg in self.args]) + ')'
@@ -75,31 +97,48 @@ class Term(object):
         return False
 
     def applyEnv(self, env):
+        if self.ground:
+            return self
         res = self.__class__.__new__(self.__class__)
         res.functor = self.functor
         res.args = [arg.applyEnv(env) for arg in self.args]
+        res.ground = all(arg.ground for arg in res.args)
         return res
 
     def query(self):
-        key = (self.functor, len(self.args))
-        if key not in kb:
-            raise Exception('Undefined procedure: ' +
-                            str(self.functor) + '/' + str(len(self.args)))
-        rules = kb[key]
-        for left, rights in rules:
-            int_names = {}
-            left = self.unique(int_names, left)
-            if rights:
-                rights_new = Terms()
-                rights_new.inverted = rights.inverted
-                rights_new += [self.unique(int_names, right)
-                               for right in rights]
-                rights = rights_new
+        profiler = activeProfiler()
+        if profiler is not None:
+            return profiler.query(self)
+        return self.solutions()
+
+    def solutions(self, stats=None):
+        rules = candidateClauses(self)
+        end, seen = len(rules), generation
+        keys = boundKeys(self) if type(rules) is list and end > 1 else None
+        pos = nextCandidate(rules, 0, end, keys, seen) if keys else 0
+        while pos < end:
+            clause = rules[pos]
+            pos = nextCandidate(rules, pos + 1, end, keys, seen) if keys else pos + 1
+            if clause.erased is not None and clause.erased <= seen:
+                continue
+            frame = [None] * clause.size
             env = {}
-            if not self.unifyWith(left, env):
+            if stats is not None:
+                stats.attempts += 1
+            if not self.unifyWith(clause.template.build(frame), env):
                 continue
-            for res in rights.query(env):
-                yield res
+            if stats is not None:
+                stats.unifications += 1
+            rights = clause.buildBody(frame)
+            if pos < end:
+                for res in rights.query(env):
+                    if rights.cut or type(res) is not FinalEnv:
+                        yield res
+                    else:
+                        yield dict(res)
+            else:
+                for res in rights.query(env):
+                    yield res
             if rights.cut:
                 return
 
@@ -107,7 +146,7 @@ class Term(object):
         return Eq(self, other)
 
     def unique(self, names, term):
-        if isinstance(term, Const):
+        if not isinstance(term, Terms) and term.ground:
             return term
         if isinstance(term, Terms):
             res = Terms()
@@ -123,78 +162,1683 @@ class Term(object):
                 elif isinstance(term.args[i], List):
                     args.append(self.unique_list(names, term.args[i]))
                 elif isinstance(term.args[i], Var):
-                    if Key(term.args[i]) in names:
-                        args.append(names[Key(term.args[i])])
+                    if term.args[i].id in names:
+                        args.append(names[term.args[i].id])
                     else:
                         intVar = IntVar()
-                        names[Key(term.args[i])] = intVar
+                        names[term.args[i].id] = intVar
                         args.append(intVar)
             res = term.__class__.__new__(term.__class__)
             res.functor = term.functor
             res.args = args
+            res.ground = False
             return res
 
     def unique_list(self, names, l):
-        first = Node(l.first.val)
-        if isinstance(first.val, Term):
-            first.val = self.unique(names, first.val)
-        elif isinstance(first.val, List):
-            first.val = self.unique_list(names, first.val)
-        elif isinstance(first.val, Var):
-            if Key(first.val) in names:
-                first.val = names[Key(first.val)]
-            else:
-                intVar = IntVar()
-                names[Key(first.val)] = intVar
-                first.val = intVar
-        temp = first
-        p = l.first.next
-        while p:
-            if isinstance(p.val, Term):
-                temp = temp.add(self.unique(names, p.val))
-            elif isinstance(p.val, List):
-                temp = temp.add(self.unique_list(names, p.val))
-            elif isinstance(p.val, Var):
-                if Key(p.val) in names:
-                    temp = temp.add(names[Key(p.val)])
+        if l.ground:
+            return l
+        items = []
+        for val in l.values():
+            if isinstance(val, Term):
+                val = self.unique(names, val)
+            elif isinstance(val, List):
+                val = self.unique_list(names, val)
+            elif isinstance(val, Var):
+                if val.id in names:
+                    val = names[val.id]
                 else:
                     intVar = IntVar()
-                    names[Key(p.val)] = intVar
-                    temp = temp.add(intVar)
-            if p is l.last:
-                break
-            p = p.next
+                    names[val.id] = intVar
+                    val = intVar
+            items.append(val)
         rest = l.rest
-        l = l.__class__.__new__(l.__class__)
-        l.first = first
-        l.last = temp
-        l.rest = rest
-        if l.rest:
-            if Key(l.rest) in names:
-                l.rest = names[Key(l.rest)]
+        if isinstance(rest, List):
+            rest = self.unique_list(names, rest)
+        elif isinstance(rest, Var):
+            if rest.id in names:
+                rest = names[rest.id]
             else:
                 intVar = IntVar()
-                names[Key(l.rest)] = intVar
-                l.rest = intVar
-        return l
+                names[rest.id] = intVar
+                rest = intVar
+        return buildList(items, rest)
+
+
+def indexKey(arg):
+    if isinstance(arg, Var) or isinstance(arg, Func):
+        return None
+    if isinstance(arg, List):
+        return List
+    if isinstance(arg, Const):
+        return arg.functor
+    return (arg.functor, len(arg.args))
+
+
+class ArgIndex(object):
+    __slots__ = ('pos', 'buckets', 'varClauses', 'hits')
+
+    def __init__(self, pos, clauses=()):
+        self.pos = pos
+        self.buckets = {}
+        self.varClauses = []
+        self.hits = 0
+        for clause in clauses:
+            self.add(clause)
+
+    def add(self, clause):
+        key = clause.indexKey(self.pos)
+        if key is None:
+            self.varClauses.append(clause)
+            for bucket in self.buckets.values():
+                bucket.append(clause)
+        else:
+            if key not in self.buckets:
+                self.buckets[key] = list(self.varClauses)
+            self.buckets[key].append(clause)
+
+    def prepend(self, clause):
+        key = clause.indexKey(self.pos)
+        if key is None:
+            self.varClauses = [clause] + self.varClauses
+            for other, bucket in list(self.buckets.items()):
+                self.buckets[other] = [clause] + bucket
+        else:
+            self.buckets[key] = [clause] + self.buckets.get(key, self.varClauses)
+
+    def lookup(self, key):
+        return self.buckets.get(key, self.varClauses)
+
+    def averageBucket(self):
+        if not self.buckets:
+            return len(self.varClauses)
+        return float(sum(len(b) for b in self.buckets.values())) / len(self.buckets)
+
+
+jitLock = threading.Lock()
+generation = 0
+
+
+class Procedure(object):
+    jitThreshold = 8
+    rules = None
+    tombstones = 0
+
+    def __init__(self, arity):
+        self.arity = arity
+        self.clauses = []
+        self.indexes = {}
+        self.modes = defaultdict(int)
+        self.factTables = 0
+
+    def __iter__(self):
+        for clause in self.live():
+            if isinstance(clause, FactTable):
+                for fact in RowSet(clause, clause.rows()):
+                    yield fact
+            else:
+                yield clause
+
+    def __len__(self):
+        return len(self.clauses) - self.tombstones
+
+    def live(self):
+        if not self.tombstones:
+            return self.clauses
+        return [clause for clause in self.clauses if clause.erased is None]
+
+    def append(self, clause):
+        with jitLock:
+            self.clauses.append(clause)
+            if self.rules is not None:
+                self.rules.append(clause)
+            if isinstance(clause, FactTable):
+                self.factTables += 1
+            if self.arity and 0 not in self.indexes:
+                self.indexes[0] = ArgIndex(0)
+            for index in self.indexes.values():
+                index.add(clause)
+
+    def prepend(self, clause):
+        with jitLock:
+            self.clauses = [clause] + self.clauses
+            if self.rules is not None:
+                self.rules.insert(0, clause)
+            if isinstance(clause, FactTable):
+                self.factTables += 1
+            if self.arity and 0 not in self.indexes:
+                self.indexes[0] = ArgIndex(0)
+            for index in self.indexes.values():
+                index.prepend(clause)
+
+    def remove(self, clause):
+        global generation
+        with jitLock:
+            generation += 1
+            clause.erased = generation
+            self.tombstones += 1
+            if self.rules is not None and clause in self.rules:
+                self.rules.remove(clause)
+            if self.tombstones * 2 > len(self.clauses):
+                self.compact()
+
+    def compact(self):
+        self.clauses = [clause for clause in self.clauses if clause.erased is None]
+        self.factTables = sum(isinstance(clause, FactTable) for clause in self.clauses)
+        self.indexes = dict((i, ArgIndex(i, self.clauses)) for i in self.indexes)
+        self.tombstones = 0
+
+    def candidates(self, goal):
+        best = self.select(goal)
+        if self.factTables:
+            return self.expandTables(best, goal)
+        return best
+
+    def select(self, goal):
+        bound = [(i, indexKey(deref(arg))) for i, arg in enumerate(goal.args)]
+        bound = [(i, key) for i, key in bound if key is not None]
+        self.modes[tuple(i for i, key in bound)] += 1
+        best = self.clauses
+        bestIndex = None
+        missing = []
+        for i, key in bound:
+            index = self.indexes.get(i)
+            if index is None:
+                missing.append((i, key))
+                continue
+            bucket = index.lookup(key)
+            if len(bucket) < len(best):
+                best, bestIndex = bucket, index
+        if len(best) > self.jitThreshold:
+            for i, key in missing:
+                index = self.buildIndex(i)
+                bucket = index.lookup(key)
+                if len(bucket) < len(best):
+                    best, bestIndex = bucket, index
+        if bestIndex is not None:
+            bestIndex.hits += 1
+        return best
+
+    def buildIndex(self, i):
+        with jitLock:
+            if i not in self.indexes:
+                self.indexes[i] = ArgIndex(i, self.clauses)
+            return self.indexes[i]
+
+    def expandTables(self, clauses, goal):
+        parts = []
+        run = []
+        for clause in clauses:
+            if clause.erased is not None:
+                continue
+            if isinstance(clause, FactTable):
+                if run:
+                    parts.append(run)
+                    run = []
+                rows = clause.match(goal)
+                if len(rows):
+                    parts.append(RowSet(clause, rows))
+            else:
+                run.append(clause)
+        if run:
+            parts.append(run)
+        if len(parts) == 1:
+            return parts[0]
+        return SegmentList(parts)
+
+    def statistics(self):
+        return {
+            'clauses': len(self),
+            'modes': dict(self.modes),
+            'indexes': dict((i, {'keys': len(index.buckets),
+                                 'varClauses': len(index.varClauses),
+                                 'hits': index.hits,
+                                 'averageBucket': index.averageBucket()})
+                            for i, index in self.indexes.items())
+        }
+
+
+class Slot(object):
+    __slots__ = ('index',)
+
+    def __init__(self, index):
+        self.index = index
+
+    def build(self, frame):
+        var = frame[self.index]
+        if var is None:
+            var = frame[self.index] = IntVar()
+        return var
+
+
+class GroundTemplate(object):
+    __slots__ = ('term',)
+
+    def __init__(self, term):
+        self.term = term
 
+    def build(self, frame):
+        return self.term
 
-def joinEnv(env1, env2):
-    env1 = env1.copy()
-    env1.update(env2)
-    return env1
+
+class TermTemplate(object):
+    __slots__ = ('cls', 'functor', 'args', 'isFunc')
+
+    def __init__(self, term, args):
+        self.cls = term.__class__
+        self.functor = term.functor
+        self.args = args
+        self.isFunc = isinstance(term, Func)
+
+    def build(self, frame):
+        res = self.cls.__new__(self.cls)
+        res.functor = self.functor
+        res.args = [arg.build(frame) for arg in self.args]
+        res.ground = False
+        return res
+
+
+class ListTemplate(object):
+    __slots__ = ('items', 'rest')
+
+    def __init__(self, items, rest):
+        self.items = items
+        self.rest = rest
+
+    def build(self, frame):
+        return buildList([item.build(frame) for item in self.items],
+                         self.rest.build(frame))
+
+
+class TermsTemplate(object):
+    __slots__ = ('inverted', 'goals')
+
+    def __init__(self, terms, goals):
+        self.inverted = terms.inverted
+        self.goals = goals
+
+    def build(self, frame):
+        res = Terms()
+        res.inverted = self.inverted
+        list.__init__(res, [goal.build(frame) for goal in self.goals])
+        return res
+
+
+def compileTemplate(term, names):
+    if isinstance(term, Terms):
+        return TermsTemplate(term, [compileTemplate(t, names) for t in term])
+    if isinstance(term, Var):
+        if term.id not in names:
+            names[term.id] = len(names)
+        return Slot(names[term.id])
+    if term.ground:
+        return GroundTemplate(term)
+    if isinstance(term, List):
+        return ListTemplate([compileTemplate(val, names) for val in term.values()],
+                            compileTemplate(term.rest, names))
+    return TermTemplate(term, [compileTemplate(arg, names) for arg in term.args])
+
+
+class Clause(object):
+    __slots__ = ('head', 'body', 'template', 'bodyTemplate', 'size', 'keys', 'erased')
+
+    def __init__(self, head, body):
+        self.head = head
+        self.body = body
+        self.erased = None
+        self.keys = tuple(indexKey(arg) for arg in head.args)
+        names = {}
+        self.template = compileTemplate(head, names)
+        self.bodyTemplate = compileTemplate(body, names) if body else None
+        self.size = len(names)
+
+    def __iter__(self):
+        return iter((self.head, self.body if self.body is not None else Terms()))
+
+    def indexKey(self, pos):
+        return self.keys[pos]
+
+    def buildBody(self, frame):
+        if self.bodyTemplate is None:
+            return Terms()
+        return self.bodyTemplate.build(frame)
+
+
+groundTerms = weakref.WeakValueDictionary()
+
+
+def internTerm(term):
+    if isinstance(term, Const) or not term.ground:
+        return term
+    key = variantKey(term, None)
+    res = groundTerms.get(key)
+    if res is None:
+        res = groundTerms.setdefault(key, term)
+    return res
+
+
+class FactTable(object):
+    dead = frozenset()
+    erased = None
+    buffers = None
+    ordered = False
+
+    def __init__(self, pred, columns):
+        self.pred = pred
+        self.columns = columns
+        self.size = len(columns[0])
+        self.hashes = {}
+        self.keyed = None
+
+    def indexKey(self, pos):
+        return None
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state.pop('buffers', None)
+        state['hashes'] = {}
+        state['keyed'] = None
+        return state
+
+    def extend(self, columns):
+        start = self.size
+        size = start + len(columns[0])
+        for i, col in enumerate(columns):
+            old = self.columns[i]
+            if isArray(old) and isArray(col) and old.dtype.kind == col.dtype.kind:
+                self.columns[i] = self.grow(i, old, col, size)
+            elif isinstance(old, list):
+                old.extend(toList(col))
+            else:
+                self.columns[i] = toList(old) + toList(col)
+        self.size = size
+        self.ordered = False
+        for i, rows in self.hashes.items():
+            for offset, val in enumerate(toList(columns[i])):
+                rows.setdefault(val, []).append(start + offset)
+        if self.keyed is not None:
+            for offset, values in enumerate(zip(*[toList(col) for col in columns])):
+                self.keyed.setdefault(values, []).append(start + offset)
+
+    def grow(self, i, old, col, size):
+        buffer = self.buffers.get(i) if self.buffers else None
+        dtype = numpy.result_type(old, col)
+        if buffer is None or old.base is not buffer or len(buffer) < size or buffer.dtype != dtype:
+            buffer = numpy.empty(max(size, 2 * len(old), 16), dtype=dtype)
+            buffer[:len(old)] = old
+            if self.buffers is None:
+                self.buffers = {}
+            self.buffers[i] = buffer
+        buffer[len(old):size] = col
+        return buffer[:size]
+
+    def value(self, i, row):
+        val = self.columns[i][row]
+        if isArray(self.columns[i]):
+            val = val.item()
+        return val
+
+    def hash(self, i):
+        if i not in self.hashes:
+            with jitLock:
+                if i not in self.hashes:
+                    rows = defaultdict(list)
+                    for row, val in enumerate(toList(self.columns[i])):
+                        rows[val].append(row)
+                    self.hashes[i] = dict(rows)
+        return self.hashes[i]
+
+    def lookup(self, i, val):
+        col = self.columns[i]
+        if i == 0 and self.ordered and isArray(col):
+            return range(numpy.searchsorted(col, val, 'left'), numpy.searchsorted(col, val, 'right'))
+        return self.hash(i).get(val, ())
+
+    def rows(self):
+        if not self.dead:
+            return range(self.size)
+        return [row for row in range(self.size) if row not in self.dead]
+
+    def tuples(self):
+        rows = list(zip(*[toList(col) for col in self.columns]))
+        if self.dead:
+            rows = [values for row, values in enumerate(rows) if row not in self.dead]
+        return rows
+
+    def find(self, values):
+        if self.keyed is None:
+            with jitLock:
+                if self.keyed is None:
+                    keyed = defaultdict(list)
+                    for row, key in enumerate(zip(*[toList(col) for col in self.columns])):
+                        keyed[key].append(row)
+                    self.keyed = dict(keyed)
+        for row in self.keyed.get(tuple(values), ()):
+            if row not in self.dead:
+                return row
+        return None
+
+    def remove(self, values):
+        row = self.find(values)
+        if row is None:
+            return False
+        with jitLock:
+            if not isinstance(self.dead, set):
+                self.dead = set(self.dead)
+            self.dead.add(row)
+            if len(self.dead) * 2 > self.size:
+                self.compact()
+        return True
+
+    def compact(self):
+        keep = self.rows()
+        self.columns = [col[numpy.array(keep, dtype=int)] if isArray(col) else [col[row] for row in keep]
+                        for col in self.columns]
+        self.size = len(keep)
+        self.dead = set()
+        self.hashes = {}
+        self.keyed = None
+        self.buffers = None
+
+    def match(self, goal):
+        rows = self.scan(goal)
+        if self.dead:
+            rows = [row for row in rows if row not in self.dead]
+        return rows
+
+    def scan(self, goal):
+        lookups = []
+        for i, arg in enumerate(goal.args):
+            arg = deref(arg)
+            if isinstance(arg, Var) or isinstance(arg, Func):
+                continue
+            if not isinstance(arg, Const) or isinstance(arg, EmptyList):
+                return ()
+            col = self.columns[i]
+            if isArray(col):
+                kind = col.dtype.kind
+                if not (kind == 'U' and isinstance(arg.functor, str) or (
+                        kind in 'iufb' and isinstance(arg.functor, numbers.Number))):
+                    return ()
+            lookups.append((i, arg.functor))
+        if lookups:
+            lookups.sort(key=lambda lookup: len(self.lookup(*lookup)))
+            i, val = lookups[0]
+            rows = self.lookup(i, val)
+            if len(lookups) > 1:
+                rows = [row for row in rows
+                        if all(self.columns[j][row] == v for j, v in lookups[1:])]
+            return rows
+        return range(self.size)
+
+
+class RowSet(object):
+    __slots__ = ('table', 'rows', 'columns')
+
+    def __init__(self, table, rows):
+        self.table = table
+        self.rows = rows
+        self.columns = table.columns
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, k):
+        row = self.rows[k]
+        head = self.table.pred(*[col[row].item() if isArray(col) else col[row]
+                                 for col in self.columns])
+        return Clause(head, None)
+
+    def __iter__(self):
+        for k in range(len(self.rows)):
+            yield self[k]
+
+
+class SegmentList(object):
+    __slots__ = ('parts', 'offsets', 'length')
+
+    def __init__(self, parts):
+        self.parts = parts
+        self.offsets = []
+        self.length = 0
+        for part in parts:
+            self.offsets.append(self.length)
+            self.length += len(part)
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, i):
+        k = bisect.bisect_right(self.offsets, i) - 1
+        return self.parts[k][i - self.offsets[k]]
+
+    def __iter__(self):
+        for part in self.parts:
+            for clause in part:
+                yield clause
+
+
+def isArray(col):
+    return numpy is not None and isinstance(col, numpy.ndarray)
+
+
+def toList(col):
+    return col.tolist() if isArray(col) else list(col)
+
+
+def toColumn(values):
+    if numpy is not None and values and len(set(map(type, values))) == 1 and \
+            type(values[0]) in (int, float, bool):
+        try:
+            return numpy.array(values)
+        except OverflowError:
+            pass
+    return values
+
+
+def load_facts(pred, rows, types=None):
+    if isinstance(rows, str):
+        with open(rows) as f:
+            rows = [row for row in csv.reader(f) if row]
+    if isArray(rows):
+        if rows.ndim != 2:
+            raise Exception('Facts must be given as a two-dimensional array')
+        columns = [rows[:, i] if rows.dtype.kind in 'iufbU' else rows[:, i].tolist()
+                   for i in range(rows.shape[1])]
+    else:
+        rows = [tuple(row) for row in rows]
+        for row in rows:
+            if len(row) != len(rows[0]):
+                raise Exception('Fact ' + repr(row) + ' has ' + str(len(row)) +
+                                ' values, expected ' + str(len(rows[0])))
+        columns = [list(col) for col in zip(*rows)]
+        if types:
+            columns = [[t(v) for v in col] if t else col
+                       for t, col in zip(types, columns)]
+        columns = [toColumn(col) for col in columns]
+    scalars = tuple(supportedConstTypes)
+    for col in columns:
+        if not isArray(col):
+            for val in col:
+                if not isinstance(val, scalars):
+                    raise Exception('Unsupported fact value ' + repr(val) +
+                                    ': facts must be numbers, strings or None')
+    if not columns or not len(columns[0]):
+        return None
+    base = currentKb()
+    key = (pred, len(columns))
+    if key not in base:
+        base[key] = Procedure(len(columns))
+    procedure = base[key]
+    views = liveViews(base, key)
+    owner = derivingView(views, key)
+    if owner is not None:
+        table = FactTable(pred, columns)
+        with jitLock:
+            procedure.rules.append(table)
+        owner.insert(key, table.tuples())
+        return table
+    last = procedure.clauses[-1] if procedure.clauses else None
+    if isinstance(last, FactTable) and (procedure.rules is None or
+                                        procedure.rules and procedure.rules[-1] is last):
+        table = last
+        with jitLock:
+            table.extend(columns)
+    else:
+        table = FactTable(pred, columns)
+        procedure.append(table)
+    if views:
+        rows = list(zip(*[toList(col) for col in columns]))
+        for view in views:
+            view.insert(key, rows)
+    base.tables.clear()
+    return table
+
+
+class Relation(object):
+    def __init__(self, rows=()):
+        self.rows = set()
+        self.indexes = {}
+        self.update(rows)
+
+    def update(self, rows):
+        added = []
+        for row in rows:
+            if row not in self.rows:
+                self.rows.add(row)
+                added.append(row)
+        for positions, index in self.indexes.items():
+            for row in added:
+                index[tuple(row[i] for i in positions)].append(row)
+        return added
+
+    def remove(self, rows):
+        for row in rows:
+            if row in self.rows:
+                self.rows.discard(row)
+                for positions, index in self.indexes.items():
+                    index[tuple(row[i] for i in positions)].remove(row)
+
+    def lookup(self, positions, key):
+        if not positions:
+            return self.rows
+        index = self.indexes.get(positions)
+        if index is None:
+            index = self.indexes[positions] = defaultdict(list)
+            for row in self.rows:
+                index[tuple(row[i] for i in positions)].append(row)
+        return index.get(key, ())
+
+
+def datalogArgs(term):
+    args = []
+    for arg in term.args:
+        if isinstance(arg, Var):
+            args.append((True, arg.id))
+        elif isinstance(arg, Const) and not isinstance(arg, EmptyList):
+            args.append((False, arg.functor))
+        else:
+            raise Exception('Cannot materialize ' + repr(term) + ': ' + repr(arg) +
+                            ' is not a variable or a constant')
+    return args
+
+
+def isRelation(term):
+    return isinstance(term, Term) and not isinstance(term, Cut) and \
+        type(term).query is Term.query
+
+
+def hasRules(procedure):
+    return procedure.rules is None and \
+        any(isinstance(clause, Clause) and clause.body is not None
+            for clause in procedure.live())
+
+
+def constantRow(term):
+    if all(isinstance(arg, Const) and not isinstance(arg, EmptyList) for arg in term.args):
+        return tuple(arg.functor for arg in term.args)
+    return None
+
+
+def factRow(clause):
+    row = constantRow(clause.head)
+    if row is None:
+        raise Exception('Cannot materialize ' + repr(clause.head) +
+                        ': the arguments of a fact must be constants')
+    return row
+
+
+def factRows(clauses):
+    rows = []
+    for clause in clauses:
+        if isinstance(clause, FactTable):
+            rows.extend(clause.tuples())
+        elif clause.body is None:
+            rows.append(factRow(clause))
+        else:
+            raise Exception('Cannot materialize ' + repr(clause.head) + ' as a base relation')
+    return rows
+
+
+def bodyTerms(body):
+    return [body] if body.inverted else list(body)
+
+
+class DatalogRule(object):
+    def __init__(self, key, clause):
+        self.key = key
+        self.clause = clause
+        self.head = datalogArgs(clause.head)
+        body = clause.body
+        self.literals = []
+        for term in bodyTerms(body):
+            if isinstance(term, Cut):
+                raise Exception('Cannot materialize ' + repr(clause.head) + ': rules with cut are not supported')
+            if isRelation(term):
+                self.literals.append((True, (term.functor, len(term.args)), datalogArgs(term)))
+            else:
+                variables = []
+                variables_list(term, variables, True)
+                self.literals.append((False, term if isinstance(term, Terms) else Terms(term),
+                                      variables))
+        self.naive = self.plan(self.order([]))
+        headVars = [val for isVar, val in self.head if isVar]
+        self.check = self.plan(self.order(headVars), headVars)
+        self.plans = {}
+
+    def deltaPlan(self, j):
+        if j not in self.plans:
+            self.plans[j] = self.plan(self.order([], j))
+        return self.plans[j]
+
+    def order(self, bound, first=None):
+        bound = set(bound)
+        order = []
+        remaining = list(range(len(self.literals)))
+        while remaining:
+            if first is not None:
+                j, first = first, None
+            else:
+                relations = [i for i in remaining if self.literals[i][0]]
+                blocked = relations[0] if relations else len(self.literals)
+                filters = [i for i in remaining if i < blocked and not self.literals[i][0]]
+                if filters:
+                    j = filters[0]
+                else:
+                    j = max(relations, key=lambda i: (sum(not isVar or val in bound
+                                                          for isVar, val in self.literals[i][2]),
+                                                      -i))
+            remaining.remove(j)
+            order.append(j)
+            isRel, lit, args = self.literals[j]
+            if isRel:
+                bound.update(val for isVar, val in args if isVar)
+            elif not lit.inverted:
+                bound.update(var.id for var in args)
+        return order
+
+    def plan(self, order, bound=()):
+        bound = set(bound)
+        steps = []
+        for j in order:
+            isRel, lit, args = self.literals[j]
+            if not isRel:
+                outputs = [] if lit.inverted else [var for var in args if var.id not in bound]
+                steps.append((j, None, lit, [var for var in args if var.id in bound], outputs))
+                bound.update(var.id for var in outputs)
+                continue
+            positions, keyArgs, outputs, checks = [], [], [], []
+            fresh = set()
+            for pos, (isVar, val) in enumerate(args):
+                if not isVar or val in bound:
+                    positions.append(pos)
+                    keyArgs.append((isVar, val))
+                elif val in fresh:
+                    checks.append((pos, val))
+                else:
+                    fresh.add(val)
+                    outputs.append((pos, val))
+            bound |= fresh
+            steps.append((j, tuple(positions), keyArgs, outputs, checks))
+        for isVar, val in self.head:
+            if isVar and val not in bound:
+                raise Exception('Cannot materialize ' + repr(self.clause.head) +
+                                ': a head variable does not occur in the body')
+        return steps
+
+    def run(self, steps, sources, out):
+        self.join(steps, 0, {}, sources, out)
+
+    def derives(self, row, sources):
+        binding = {}
+        for (isVar, val), value in zip(self.head, row):
+            if not isVar:
+                if val != value:
+                    return False
+            elif binding.setdefault(val, value) != value:
+                return False
+        out = []
+        self.join(self.check, 0, binding, sources, out)
+        return bool(out)
+
+    def join(self, steps, k, binding, sources, out):
+        if k == len(steps):
+            out.append(tuple(binding[val] if isVar else val for isVar, val in self.head))
+            return
+        step = steps[k]
+        if step[1] is None:
+            j, _, terms, inputs, outputs = step
+            env = dict((var.id, fromPythonArg(binding[var.id])) for var in inputs)
+            for res in terms.query(env):
+                for var in outputs:
+                    val = var.applyEnv(res)
+                    if not isinstance(val, Const) or isinstance(val, EmptyList):
+                        raise Exception('Cannot materialize ' + repr(terms) + ': ' +
+                                        repr(var) + ' is not bound to a constant')
+                    binding[var.id] = val.functor
+                self.join(steps, k + 1, binding, sources, out)
+            return
+        j, positions, keyArgs, outputs, checks = step
+        key = tuple(binding[val] if isVar else val for isVar, val in keyArgs)
+        for row in sources[j].lookup(positions, key):
+            for pos, val in outputs:
+                binding[val] = row[pos]
+            if checks and any(row[pos] != binding[val] for pos, val in checks):
+                continue
+            self.join(steps, k + 1, binding, sources, out)
+
+
+class View(object):
+    def __init__(self, base, derived):
+        self.base = base
+        self.derived = derived
+        self.procedures = {}
+        self.full = {}
+        self.facts = {}
+        self.counts = {}
+        self.relations = {}
+        self.rules = []
+        self.byHead = defaultdict(list)
+        self.byLiteral = defaultdict(list)
+        for key, clauses in derived.items():
+            self.procedures[key] = base[key]
+            self.full[key] = self.relations[key] = Relation()
+            self.facts[key] = Counter()
+            for clause in clauses:
+                if isinstance(clause, Clause) and clause.body is not None:
+                    rule = DatalogRule(key, clause)
+                    self.rules.append(rule)
+                    self.byHead[key].append(rule)
+                else:
+                    self.facts[key].update(factRows([clause]))
+        self.watched = set()
+        for rule in self.rules:
+            for j, (isRel, litKey, args) in enumerate(rule.literals):
+                if not isRel:
+                    self.watched.update(goalKeys(litKey))
+                    continue
+                self.byLiteral[litKey].append((rule, j))
+                if litKey not in self.relations:
+                    self.procedures[litKey] = base[litKey]
+                    self.counts[litKey] = Counter(factRows(base[litKey].live()))
+                    self.relations[litKey] = Relation(self.counts[litKey])
+        self.watched = dependencies(base, self.watched)
+        for key in self.watched:
+            self.procedures[key] = base.get(key)
+        self.sources = dict((id(rule), [self.relations[litKey] if isRel else None
+                                        for isRel, litKey, args in rule.literals])
+                            for rule in self.rules)
+
+    def compute(self):
+        out = dict((key, list(facts)) for key, facts in self.facts.items())
+        for rule in self.rules:
+            rule.run(rule.naive, self.sources[id(rule)], out[rule.key])
+        self.propagate(dict((key, self.full[key].update(rows)) for key, rows in out.items()))
+
+    def deltas(self, delta):
+        out = defaultdict(list)
+        for key, relation in delta.items():
+            for rule, j in self.byLiteral.get(key, ()):
+                sources = list(self.sources[id(rule)])
+                sources[j] = relation
+                rule.run(rule.deltaPlan(j), sources, out[rule.key])
+        return out
+
+    def propagate(self, added):
+        changes = defaultdict(list)
+        delta = {}
+        for key, rows in added.items():
+            if rows:
+                delta[key] = Relation(rows)
+                if key in self.full:
+                    changes[key].extend(rows)
+        while delta:
+            out = self.deltas(delta)
+            delta = {}
+            for key, rows in out.items():
+                rows = self.full[key].update(rows)
+                if rows:
+                    delta[key] = Relation(rows)
+                    changes[key].extend(rows)
+        return changes
+
+    def derivable(self, key, row):
+        return any(rule.derives(row, self.sources[id(rule)]) for rule in self.byHead[key])
+
+    def insert(self, key, rows):
+        if key in self.watched:
+            return self.refresh()
+        counts = self.facts[key] if key in self.full else self.counts[key]
+        fresh = []
+        for row in rows:
+            counts[row] += 1
+            if counts[row] == 1:
+                fresh.append(row)
+        changes = self.propagate({key: self.relations[key].update(fresh)})
+        self.publish(changes, {})
+
+    def delete(self, key, rows):
+        if key in self.watched:
+            return self.refresh()
+        counts = self.facts[key] if key in self.full else self.counts[key]
+        gone = []
+        for row in rows:
+            if counts[row] > 0:
+                counts[row] -= 1
+                if not counts[row]:
+                    del counts[row]
+                    gone.append(row)
+        gone = [row for row in gone if row in self.relations[key].rows]
+        if not gone:
+            return
+        over = defaultdict(set)
+        if key in self.full:
+            over[key].update(gone)
+        delta = {key: Relation(gone)}
+        while delta:
+            out = self.deltas(delta)
+            delta = {}
+            for k, rows in out.items():
+                fresh = set(row for row in rows if row in self.full[k].rows and row not in over[k])
+                if fresh:
+                    over[k] |= fresh
+                    delta[k] = Relation(fresh)
+        if key not in self.full:
+            self.relations[key].remove(gone)
+        for k, rows in over.items():
+            self.full[k].remove(rows)
+        back = {}
+        for k, rows in over.items():
+            rows = [row for row in rows if row in self.facts[k] or self.derivable(k, row)]
+            back[k] = self.full[k].update(rows)
+        changes = self.propagate(back)
+        removed = dict((k, [row for row in rows if row not in self.full[k].rows])
+                       for k, rows in over.items())
+        added = dict((k, [row for row in rows if row not in over[k]])
+                     for k, rows in changes.items())
+        self.publish(added, removed)
+
+    def publish(self, added, removed):
+        for key in self.derived:
+            if added.get(key) or removed.get(key):
+                self.store(key, added.get(key, ()), removed.get(key, ()))
+        for key in self.derived:
+            for view in liveViews(self.base, key):
+                if view is not self and key not in view.derived:
+                    if removed.get(key):
+                        view.delete(key, removed[key])
+                    if added.get(key):
+                        view.insert(key, added[key])
+        self.base.tables.clear()
+
+    def store(self, key, added, removed):
+        procedure = self.procedures[key]
+        clauses = procedure.clauses
+        table = clauses[0] if len(clauses) == 1 and isinstance(clauses[0], FactTable) else None
+        if table is None:
+            installRelation(procedure, key, self.full[key].rows, procedure.rules)
+            return
+        for row in removed:
+            table.remove(row)
+        if added:
+            with jitLock:
+                table.extend([toColumn(list(col)) for col in zip(*added)])
+
+    def assertClause(self, key, clause):
+        if clause.body is not None or key in self.watched:
+            if key in self.derived:
+                with jitLock:
+                    self.procedures[key].rules.append(clause)
+            return self.refresh()
+        row = factRow(clause)
+        if key in self.derived:
+            with jitLock:
+                self.procedures[key].rules.append(clause)
+        self.insert(key, [row])
+
+    def refresh(self):
+        materialize(*set(key[0] for key in self.derived))
+
+    def close(self):
+        for key in list(self.relations) + list(self.watched):
+            views = self.base.views.get(key)
+            if views and self in views:
+                views.remove(self)
+
+
+def goalKeys(terms):
+    keys = set()
+    for term in terms:
+        if isinstance(term, Terms):
+            keys |= goalKeys(term)
+        elif isRelation(term):
+            keys.add((term.functor, len(term.args)))
+    return keys
+
+
+def dependencies(base, keys):
+    keys = set(keys)
+    pending = list(keys)
+    while pending:
+        procedure = base.get(pending.pop())
+        if procedure is None:
+            continue
+        for clause in procedure.rules if procedure.rules is not None else procedure.live():
+            if isinstance(clause, Clause) and clause.body is not None:
+                for key in goalKeys(clause.body) - keys:
+                    keys.add(key)
+                    pending.append(key)
+    return keys
+
+
+def liveViews(base, key):
+    return [view for view in base.views.get(key, ())
+            if view.procedures.get(key) is base.get(key)]
+
+
+def derivingView(views, key):
+    for view in views:
+        if key in view.derived:
+            return view
+    return None
+
+
+def materialize(*preds):
+    base = currentKb()
+    derived = OrderedDict()
+    pending = [key for key in base if key[0] in preds]
+    for pred in preds:
+        if not any(key[0] is pred for key in pending):
+            raise Exception('Undefined procedure: ' + str(pred))
+    while pending:
+        key = pending.pop()
+        if key in derived:
+            continue
+        procedure = base[key]
+        derived[key] = list(procedure.rules if procedure.rules is not None else procedure.live())
+        for old in liveViews(base, key):
+            if key in old.derived:
+                pending.extend(old.derived)
+        for clause in derived[key]:
+            if not isinstance(clause, Clause) or clause.body is None:
+                continue
+            for term in bodyTerms(clause.body):
+                if isRelation(term):
+                    litKey = (term.functor, len(term.args))
+                    if litKey not in base:
+                        raise Exception('Undefined procedure: ' +
+                                        str(term.functor) + '/' + str(len(term.args)))
+                    if hasRules(base[litKey]):
+                        pending.append(litKey)
+    lower = set()
+    for key, clauses in derived.items():
+        for clause in clauses:
+            if not isinstance(clause, Clause) or clause.body is None:
+                continue
+            for term in bodyTerms(clause.body):
+                if isRelation(term):
+                    continue
+                for litKey in goalKeys(term if isinstance(term, Terms) else Terms(term)):
+                    if litKey in derived or litKey in base and hasRules(base[litKey]):
+                        if key in dependencies(base, [litKey]):
+                            raise Exception('Cannot materialize ' + repr(clause.head) + ': ' +
+                                            str(litKey[0]) + '/' + str(litKey[1]) +
+                                            ' depends on it through a negated or filtered goal')
+                        lower.add(litKey)
+    if lower:
+        counts = materialize(*set(key[0] for key in lower))
+        rest = [pred for pred in preds if not any(key[0] is pred for key in lower)]
+        if rest:
+            counts.update(materialize(*rest))
+        return counts
+    view = View(base, derived)
+    view.compute()
+    for key in derived:
+        for old in list(base.views.get(key, ())):
+            if key in old.derived:
+                old.close()
+    for key in list(view.relations) + list(view.watched):
+        base.views.setdefault(key, []).append(view)
+    counts = {}
+    for key, clauses in derived.items():
+        installRelation(base[key], key, view.full[key].rows, clauses)
+        counts[key] = len(view.full[key].rows)
+    for key in derived:
+        rows = view.full[key].rows
+        for other in liveViews(base, key):
+            if other is not view and key not in other.derived:
+                known = other.relations.get(key)
+                if known is None:
+                    other.refresh()
+                    continue
+                other.delete(key, [row for row in known.rows if row not in rows])
+                other.insert(key, [row for row in rows if row not in known.rows])
+    base.tables.clear()
+    return counts
+
+
+def retract(head, body=None):
+    base = currentKb()
+    key = (head.functor, len(head.args))
+    procedure = base.get(key)
+    if procedure is None:
+        return False
+    if isinstance(body, Term):
+        body = Terms(body)
+    views = liveViews(base, key)
+    owner = derivingView(views, key)
+    for clause in procedure.rules if owner is not None else procedure.select(head):
+        if clause.erased is not None:
+            continue
+        if isinstance(clause, FactTable):
+            row = None if body is not None else matchingRow(clause, head)
+            if row is None or not clause.remove(row):
+                continue
+        elif body is None:
+            if clause.body is not None or \
+                    not head.unifyWith(clause.template.build([None] * clause.size), {}):
+                continue
+            row = constantRow(clause.head)
+        elif clause.body is None or not matchClause(head, body, clause):
+            continue
+        if owner is not None and not isinstance(clause, FactTable):
+            with jitLock:
+                procedure.rules.remove(clause)
+        elif not isinstance(clause, FactTable):
+            procedure.remove(clause)
+        if body is not None:
+            for view in [owner] if owner is not None else views:
+                view.refresh()
+        elif owner is not None:
+            owner.delete(key, [row])
+        else:
+            for view in views:
+                view.delete(key, [row])
+        base.tables.clear()
+        return True
+    return False
+
+
+def matchingRow(table, head):
+    for row in table.match(head):
+        values = tuple(table.value(i, row) for i in range(len(table.columns)))
+        if head.unifyWith(table.pred(*values), {}):
+            return values
+    return None
+
+
+def matchClause(head, body, clause):
+    frame = [None] * clause.size
+    env = {}
+    return matchTerm(head, clause.template.build(frame), env) and \
+        matchTerm(body, clause.buildBody(frame), env)
+
+
+def matchTerm(term, other, env):
+    if isinstance(term, Terms) or isinstance(other, Terms):
+        return isinstance(term, Terms) and isinstance(other, Terms) and \
+            term.inverted == other.inverted and len(term) == len(other) and \
+            all(matchTerm(a, b, env) for a, b in zip(term, other))
+    term = term.applyEnv(env)
+    other = other.applyEnv(env)
+    if isinstance(other, Var):
+        term, other = other, term
+    if isinstance(term, Var):
+        if term is not other:
+            env[term.id] = other
+        return True
+    if isinstance(term, Func) or isinstance(other, Func):
+        return type(term) is type(other) and len(term.args) == len(other.args) and \
+            all(matchTerm(a, b, env) for a, b in zip(term.args, other.args))
+    if isinstance(term, (Const, List)) or isinstance(other, (Const, List)):
+        return term.unifyWith(other, env)
+    return term.functor == other.functor and len(term.args) == len(other.args) and \
+        all(matchTerm(a, b, env) for a, b in zip(term.args, other.args))
+
+
+def installRelation(procedure, key, rows, rules):
+    try:
+        rows = sorted(rows)
+        ordered = True
+    except TypeError:
+        rows = list(rows)
+        ordered = False
+    pred, arity = key
+    clauses = []
+    if rows and arity:
+        table = FactTable(pred, [toColumn(list(col)) for col in zip(*rows)])
+        table.ordered = ordered
+        clauses.append(table)
+    elif rows:
+        clauses.append(Clause(pred(), None))
+    with jitLock:
+        procedure.rules = rules
+        procedure.clauses = clauses
+        procedure.factTables = sum(isinstance(clause, FactTable) for clause in clauses)
+        procedure.indexes = {0: ArgIndex(0, clauses)} if arity else {}
+        procedure.tombstones = 0
+
+
+snapshotMagic = b'LOGICKB1'
+snapshotAlign = 64
+
+
+class SnapshotPickler(pickle.Pickler):
+    def __init__(self, file):
+        pickle.Pickler.__init__(self, file, pickle.HIGHEST_PROTOCOL)
+        self.arrays = []
+
+    def persistent_id(self, obj):
+        if isArray(obj) and obj.dtype.kind != 'O':
+            self.arrays.append(numpy.ascontiguousarray(obj))
+            return len(self.arrays) - 1
+        return None
+
+
+class SnapshotUnpickler(pickle.Unpickler):
+    def __init__(self, file, path, layout, mmap):
+        pickle.Unpickler.__init__(self, file)
+        self.path = path
+        self.layout = layout
+        self.mmap = mmap
+
+    def persistent_load(self, pid):
+        if numpy is None:
+            raise Exception('Snapshot contains numpy columns but numpy is not available')
+        dtype, shape, offset = self.layout[pid]
+        array = numpy.memmap(self.path, dtype=numpy.dtype(dtype), mode='r',
+                             offset=offset, shape=shape)
+        return array if self.mmap else numpy.array(array)
+
+
+def align(n):
+    return (n + snapshotAlign - 1) // snapshotAlign * snapshotAlign
+
+
+def snapshotRow(clause):
+    if not isinstance(clause, Clause) or clause.body is not None or not clause.head.args:
+        return None
+    for arg in clause.head.args:
+        if not isinstance(arg, Const) or type(arg.functor) not in (int, float, bool, str):
+            return None
+    return tuple(arg.functor for arg in clause.head.args)
+
+
+def snapshotColumn(values):
+    col = toColumn(values)
+    if isArray(col) or numpy is None or not all(type(val) is str for val in values):
+        return col
+    lengths = [len(val) for val in values]
+    if max(lengths) > max(8, 2 * sum(lengths) // len(lengths)) or \
+            any(val.endswith('\0') for val in values):
+        return col
+    return numpy.array(values, dtype=str)
+
+
+def snapshotProcedure(key, procedure):
+    clauses = []
+    rows = []
+    for clause in procedure.live() + [None]:
+        row = snapshotRow(clause)
+        if row is not None:
+            rows.append(row)
+            continue
+        if rows:
+            clauses.append(FactTable(key[0], [snapshotColumn(list(col)) for col in zip(*rows)]))
+            rows = []
+        if clause is not None:
+            clauses.append(clause)
+    if len(clauses) == len(procedure.clauses) and not procedure.tombstones:
+        return procedure
+    copy = Procedure.__new__(Procedure)
+    copy.__dict__.update(procedure.__dict__)
+    copy.clauses = clauses
+    copy.tombstones = 0
+    copy.factTables = sum(isinstance(clause, FactTable) for clause in clauses)
+    copy.indexes = dict((i, ArgIndex(i, clauses)) for i in procedure.indexes)
+    return copy
+
+
+def save_kb(path):
+    body = io.BytesIO()
+    pickler = SnapshotPickler(body)
+    pickler.dump((OrderedDict((key, snapshotProcedure(key, procedure))
+                              for key, procedure in currentKb().items()), next(varIds)))
+    body = body.getvalue()
+    layout = []
+    offset = 0
+    for array in pickler.arrays:
+        layout.append((array.dtype.str, array.shape, offset))
+        offset = align(offset + array.nbytes)
+    table = pickle.dumps(layout, pickle.HIGHEST_PROTOCOL)
+    start = align(len(snapshotMagic) + 16 + len(body) + len(table))
+    with open(path, 'wb') as f:
+        f.write(snapshotMagic)
+        f.write(struct.pack('<QQ', len(body), len(table)))
+        f.write(body)
+        f.write(table)
+        for array, (dtype, shape, offset) in zip(pickler.arrays, layout):
+            f.write(b'\0' * (start + offset - f.tell()))
+            f.write(array.tobytes())
+
+
+def load_kb(path, mmap=True):
+    global varIds
+    with open(path, 'rb') as f:
+        if f.read(len(snapshotMagic)) != snapshotMagic:
+            raise Exception('Not a knowledge base snapshot: ' + str(path))
+        bodySize, tableSize = struct.unpack('<QQ', f.read(16))
+        body = f.read(bodySize)
+        layout = pickle.loads(f.read(tableSize))
+    start = align(len(snapshotMagic) + 16 + bodySize + tableSize)
+    layout = [(dtype, shape, start + offset) for dtype, shape, offset in layout]
+    loaded, nextId = SnapshotUnpickler(io.BytesIO(body), path, layout, mmap).load()
+    base = currentKb()
+    base.clear()
+    base.update(loaded)
+    base.tables.clear()
+    varIds = itertools.count(max(next(varIds), nextId))
+    for procedure in base.values():
+        if procedure.tombstones:
+            procedure.compact()
+    if internGroundTerms:
+        for procedure in base.values():
+            for clause in procedure.clauses:
+                if isinstance(clause, Clause):
+                    for arg in clause.head.args:
+                        internTerm(arg)
+    return base
+
+
+def addClause(head, body, front=False):
+    if isinstance(body, Term):
+        body = Terms(body)
+    if internGroundTerms:
+        head.args = [internTerm(arg) for arg in head.args]
+    base = currentKb()
+    key = (head.functor, len(head.args))
+    if key not in base:
+        base[key] = Procedure(len(head.args))
+    clause = Clause(head, body)
+    views = liveViews(base, key)
+    owner = derivingView(views, key)
+    if owner is not None:
+        owner.assertClause(key, clause)
+    else:
+        if body is None and any(key in view.relations for view in views):
+            factRow(clause)
+        if front:
+            base[key].prepend(clause)
+        else:
+            base[key].append(clause)
+        for view in views:
+            view.assertClause(key, clause)
+    base.tables.clear()
+
+
+def assertz(head, body=None):
+    addClause(head, body)
+
+
+def asserta(head, body=None):
+    addClause(head, body, front=True)
+
+
+def candidateClauses(goal, engine=None):
+    base = currentKb()
+    key = (goal.functor, len(goal.args))
+    if key not in base:
+        raise Exception('Undefined procedure: ' +
+                        str(goal.functor) + '/' + str(len(goal.args)))
+    if goal.tabled:
+        return base.tables.answers(goal, base[key], engine)
+    return base[key].candidates(goal)
+
+
+def boundKeys(goal):
+    keys = []
+    for pos, arg in enumerate(goal.args):
+        key = indexKey(deref(arg))
+        if key is not None:
+            keys.append((pos, key))
+    return keys or None
+
+
+def nextCandidate(clauses, start, end, keys, seen):
+    for i in range(start, end):
+        clause = clauses[i]
+        if clause.erased is not None and clause.erased <= seen:
+            continue
+        heads = clause.keys
+        for pos, key in keys:
+            other = heads[pos]
+            if other is not None and other != key:
+                break
+        else:
+            return i
+    return end
+
+
+def narrow(choice):
+    clauses = choice.clauses
+    if type(clauses) is list and choice.end > 1:
+        choice.keys = boundKeys(choice.goal)
+        if choice.keys is not None:
+            choice.pos = nextCandidate(clauses, 0, choice.end, choice.keys, choice.seen)
+
+
+def variantKey(term, names):
+    term = deref(term)
+    if isinstance(term, Var):
+        if term.id not in names:
+            names[term.id] = len(names)
+        return names[term.id]
+    if isinstance(term, Const):
+        if isinstance(term.functor, float):
+            return (float, repr(term.functor))
+        return (type(term.functor), term.functor)
+    if isinstance(term, List):
+        items = []
+        while isinstance(term, List):
+            items.extend(variantKey(val, names) for val in term.values())
+            term = deref(term.rest)
+        return (List, tuple(items), variantKey(term, names))
+    return (term.functor, tuple(variantKey(arg, names) for arg in term.args))
+
+
+class Table(object):
+    def __init__(self):
+        self.answers = []
+        self.keys = set()
+        self.complete = False
+        self.evaluating = False
+        self.depth = self.link = 0
+        self.call = self.procedure = None
+
+
+class TableSpace(object):
+    def __init__(self, maxAnswers=None):
+        self.tables = OrderedDict()
+        self.maxAnswers = maxAnswers
+        self.size = 0
+        self.active = []
+        self.waiting = []
+        self.changes = 0
+        self.lock = threading.RLock()
+
+    def answers(self, goal, procedure, engine=None):
+        with self.lock:
+            return self.lookup(goal, procedure, engine)
+
+    def ready(self, goal):
+        table = self.tables.get(variantKey(goal, {}))
+        return table is not None and table.complete
+
+    def lookup(self, goal, procedure, engine):
+        key = variantKey(goal, {})
+        table = self.tables.get(key)
+        if table is None:
+            table = self.tables[key] = Table()
+        elif table.complete:
+            self.tables.move_to_end(key)
+            return table.answers
+        elif table.evaluating:
+            caller = self.active[-1]
+            caller.link = min(caller.link, table.depth)
+            return list(table.answers)
+        elif table in self.waiting:
+            caller = self.active[-1]
+            caller.link = min(caller.link, table.link)
+            return list(table.answers)
+        self.evaluate(table, goal, procedure, engine)
+        if table.complete:
+            if not self.active:
+                self.evict()
+            return table.answers
+        return list(table.answers)
+
+    def evaluate(self, table, goal, procedure, engine):
+        table.call = Clause(goal.applyEnv({}), None)
+        table.procedure = procedure
+        table.depth = table.link = len(self.active)
+        start = len(self.waiting)
+        solver = engine.tableEngine() if engine is not None else TrailEngine()
+        try:
+            while True:
+                changes = self.changes
+                self.fill(table, solver)
+                for member in self.waiting[start:]:
+                    self.fill(member, solver)
+                    table.link = min(table.link, member.link)
+                if self.changes == changes:
+                    break
+        except BaseException:
+            del self.waiting[start:]
+            raise
+        if table.link < table.depth:
+            caller = self.active[-1]
+            caller.link = min(caller.link, table.link)
+            self.waiting.append(table)
+        else:
+            for member in self.waiting[start:] + [table]:
+                if not member.complete:
+                    member.complete = True
+                    member.keys = None
+                    self.size += len(member.answers)
+            del self.waiting[start:]
+
+    def fill(self, table, solver):
+        table.depth = len(self.active)
+        table.evaluating = True
+        self.active.append(table)
+        try:
+            call = table.call
+            head = call.template.build([None] * call.size)
+            for _ in solver.resolve(head, table.procedure.candidates(head)):
+                answer = head.applyEnv({})
+                key = variantKey(answer, {})
+                if key not in table.keys:
+                    table.keys.add(key)
+                    table.answers.append(Clause(answer, None))
+                    self.changes += 1
+            solver.undo(0)
+        finally:
+            self.active.pop()
+            table.evaluating = False
+
+    def evict(self):
+        if self.maxAnswers is None:
+            return
+        for key in list(self.tables):
+            if self.size <= self.maxAnswers:
+                break
+            table = self.tables[key]
+            if table.complete:
+                self.size -= len(table.answers)
+                del self.tables[key]
+
+    def clear(self, pred=None):
+        if not self.tables:
+            return
+        with self.lock:
+            self.discard(pred)
+
+    def discard(self, pred):
+        for key in list(self.tables):
+            table = self.tables[key]
+            if pred is not None and key[0] is not pred:
+                continue
+            if table.complete:
+                self.size -= len(table.answers)
+                del self.tables[key]
+            elif not table.evaluating and table not in self.waiting:
+                del self.tables[key]
+
+
+class KnowledgeBase(OrderedDict):
+    def __init__(self, maxAnswers=None):
+        OrderedDict.__init__(self)
+        self.tables = TableSpace(maxAnswers)
+        self.views = {}
+
+    def __enter__(self):
+        kbStack().append(self)
+        return self
+
+    def __exit__(self, *args):
+        kbStack().pop()
+
+    def query(self, x, **kwargs):
+        with self:
+            return query(x, **kwargs)
+
+    def aquery(self, x, **kwargs):
+        with self:
+            return aquery(x, **kwargs)
+
+    def bind(self, results):
+        while True:
+            with self:
+                try:
+                    result = next(results)
+                except StopIteration:
+                    return
+            yield result
+
+
+local = threading.local()
+
+
+def kbStack():
+    if not hasattr(local, 'stack'):
+        local.stack = []
+    return local.stack
+
+
+def currentKb():
+    stack = kbStack()
+    return stack[-1] if stack else kb
+
+
+def activeProfiler():
+    return getattr(local, 'profiler', None)
+
+
+def useKb(base):
+    kbStack()[:] = [base]
+
+
+kb = KnowledgeBase()
+tables = kb.tables
 
 
 class Const(Term):
+    __slots__ = ()
     args = []
+    ground = True
+    interned = weakref.WeakValueDictionary()
+
+    def __new__(cls, *args):
+        if args and type(args[0]) not in internedTypes and not (
+                type(args[0]) is int and -internedInts <= args[0] < internedInts):
+            return object.__new__(cls)
+        key = (cls, type(args[0]), args[0]) if args else (cls,)
+        self = Const.interned.get(key)
+        if self is None:
+            self = Const.interned.setdefault(key, object.__new__(cls))
+        return self
 
     def __init__(self, val):
         self.functor = val
 
+    def __reduce__(self):
+        return (self.__class__, (self.functor,))
+
     def __repr__(self):
         return repr(self.functor)
 
     def unifyWith(self, other, env):
+        if self is other:
+            return True
         if isinstance(other, Var) or isinstance(other, Func):
             return other.unifyWith(self, env)
         if isinstance(other, Const):
@@ -205,7 +1849,7 @@ class Const(Term):
         return self
 
     def __hash__(self):
-        return hash(str(self))
+        return hash(self.functor)
 
 
 class Singleton(type):
@@ -222,6 +1866,8 @@ class Cut(Term):
 
 
 class Terms(list):
+    __slots__ = ('inverted', 'cut')
+
     def __init__(self, term=None):
         if term:
             list.__init__(self, [term])
@@ -260,37 +1906,40 @@ class Terms(list):
     def query(self, env={}):
         index = 0
         prev = None
-        while index >= 0:
+        while True:
             if index == len(self):
                 if self.inverted:
                     return
-                yield env
                 if prev is None:
+                    yield env if type(env) is FinalEnv else FinalEnv(env)
                     return
+                yield env
                 state = prev
-                index -= 1
             elif isinstance(self[index], Cut):
                 index += 1
                 self.cut = True
                 prev = None
                 continue
             else:
-                state = State(self[index], env, prev)
+                state = State(self[index], env, prev, index)
             env = state.generate()
             while env is None:
                 state = state.prev
-                index -= 1
                 if state is None:
                     if self.inverted:
-                        yield {}
+                        yield FinalEnv()
                     return
                 env = state.generate()
-            index += 1
-            prev = state
+            index = state.index + 1
+            prev = state.prev if state.exhausted else state
+
+
+varIds = itertools.count()
 
 
 class Var(object):
-    rank = 0
+    __slots__ = ('name', 'ref', 'id')
+    ground = False
 
     def __init__(self, name):
         if not isinstance(name, str):
@@ -298,6 +1947,8 @@ class Var(object):
         if name.startswith('_G'):
             raise Exception('The name of variable cannot start with \'_G\'')
         self.name = name
+        self.ref = None
+        self.id = next(varIds)
 
     def __repr__(self):
         return self.name
@@ -359,7 +2010,7 @@ class Var(object):
         return GT(self, other)
 
     def __hash__(self):
-        return hash(str(self))
+        return self.id
 
     def unifyWith(self, other, env):
         if isinstance(other, Func):
@@ -368,22 +2019,20 @@ class Var(object):
         other = other.applyEnv(env)
         if self is other:
             return True
-        if isinstance(other, Var):
-            if self.rank < other.rank:
-                env[Key(self)] = other
-            elif self.rank > other.rank:
-                env[Key(other)] = self
-            else:
-                env[Key(self)] = other
-                other.rank += 1
+        if not isinstance(self, Var):
+            return self.unifyWith(other, env)
+        if isinstance(other, Var) and other.id > self.id:
+            env[other.id] = self
         else:
-            env[Key(self)] = other
+            env[self.id] = other
         return True
 
     def applyEnv(self, env):
-        if Key(self) in env:
-            env[Key(self)] = env[Key(self)].applyEnv(env)
-            return env[Key(self)]
+        if self.ref is not None:
+            return self.ref.applyEnv(env)
+        if self.id in env:
+            env[self.id] = env[self.id].applyEnv(env)
+            return env[self.id]
         return self
 
     def __eq__(self, other):
@@ -405,16 +2054,24 @@ _ = AnonVar()
 
 
 class Func(Term):
+    __slots__ = ()
+
     def function(self, *args):
         raise Exception('function in ' + self + ' is not defined')
 
     def __init__(self, *args):
         self.functor = self.function
         self.args = [fromPythonArg(arg) for arg in args]
+        self.ground = False
 
     def __repr__(self):
         return self.__class__.__name__ + '.' + Term.__repr__(self)
 
+    def applyEnv(self, env):
+        res = Term.applyEnv(self, env)
+        res.ground = False
+        return res
+
     def __add__(self, other):
         return Add(self, other)
 
@@ -491,7 +2148,17 @@ class Func(Term):
 
     def query(self):
         self.eval()
-        yield {}
+        yield FinalEnv()
+
+
+class AsyncFunc(Func):
+    __slots__ = ()
+
+    def eval(self):
+        raise Exception(repr(self) + ' can only be evaluated by aquery')
+
+    async def evalAsync(self):
+        return await Func.eval(self)
 
 
 class format(Func):
@@ -502,7 +2169,7 @@ class format(Func):
 class BoolFunc(Func):
     def query(self):
         if self.eval():
-            yield {}
+            yield FinalEnv()
 
 
 class Add(Func):
@@ -547,7 +2214,7 @@ class GT(BoolFunc):
 
 class Eq(Term):
     def query(self):
-        env = {}
+        env = FinalEnv()
         if self.args[0].unifyWith(self.args[1], env):
             yield env
 
@@ -555,24 +2222,11 @@ class Eq(Term):
 class NE(Term):
     def query(self):
         if not self.args[0].unifyWith(self.args[1], {}):
-            yield {}
-
-
-class Key(object):
-    def __init__(self, var):
-        self.var = var
-
-    def __hash__(self):
-        return hash(self.var)
-
-    def __eq__(self, other):
-        return isinstance(other, Key) and self.var is other.var
-
-    def __repr__(self):
-        return repr(self.var)
+            yield FinalEnv()
 
 
 class EmptyList(Const):
+    __slots__ = ()
     __metaclass__ = Singleton
 
     def __init__(self):
@@ -594,55 +2248,60 @@ class EmptyList(Const):
     def __nonzero__(self):
         return False
 
-    def __hash__(self):
-        return hash(repr(self))
-
-
-class Node(object):
-    def __init__(self, val, prev=None, next=None):
-        self.val = val
-        self.prev = prev
-        self.next = next
+    __bool__ = __nonzero__
 
-    def add(self, val):
-        self.next = Node(val, self)
-        return self.next
+    def __reduce__(self):
+        return (EmptyList, ())
 
 
 class List(object):
+    __slots__ = ('items', 'start', 'rest', 'ground', '__weakref__')
+
     def __init__(self, l, rest=EmptyList()):
-        self.first = Node(fromPythonArg(l[0]))
-        temp = self.first
-        for i in range(1, len(l)):
-            temp = temp.add(fromPythonArg(l[i]))
-        self.last = temp
+        self.items = tuple(fromPythonArg(val) for val in l)
+        self.start = 0
         self.rest = rest
+        self.ground = rest.ground and all(val.ground for val in self.items)
 
     def __repr__(self):
-        res = '[' + repr(self.first.val)
-        if self.first is not self.last:
-            temp = self.first.next
-            while temp:
-                res += ',' + repr(temp.val)
-                if temp is self.last:
-                    break
-                temp = temp.next
-        res += ']'
-        if self.rest:
-            res += '+' + repr(self.rest)
+        vals = []
+        l = self
+        while True:
+            vals.extend(repr(val) for val in l.values())
+            if not isinstance(l.rest, List):
+                break
+            l = l.rest
+        res = '[' + ','.join(vals) + ']'
+        if l.rest:
+            res += '+' + repr(l.rest)
         return res
 
+    def values(self):
+        items = self.items
+        for i in range(self.start, len(items)):
+            yield items[i]
+
+    def __reduce__(self):
+        items = []
+        l = self
+        while True:
+            items.extend(l.values())
+            if not isinstance(l.rest, List):
+                break
+            l = l.rest
+        return (buildList, (tuple(items), l.rest))
+
     def toPythonList(self):
-        if self.rest:
-            raise Exception(repr(self.rest) + ' in ' +
-                            repr(self) + ' is unknown.')
         acc = []
-        temp = self.first
-        while temp:
-            acc.append(toPythonArg(temp.val))
-            if temp is self.last:
+        l = self
+        while True:
+            acc.extend(toPythonArg(val) for val in l.values())
+            if not isinstance(l.rest, List):
                 break
-            temp = temp.next
+            l = l.rest
+        if l.rest:
+            raise Exception(repr(l.rest) + ' in ' +
+                            repr(self) + ' is unknown.')
         return acc
 
     def __add__(self, other):
@@ -654,98 +2313,125 @@ class List(object):
         if self.rest:
             raise Exception(repr(self.rest) + ' in ' +
                             repr(self) + ' is unknown.')
-        self.last.next = other.first
-        other.first.prev = self.last
-        res = self.__class__.__new__(self.__class__)
-        res.first = self.first
-        res.last = other.last
-        res.rest = other.rest
-        return res
+        return buildList(self.items[self.start:] + other.items[other.start:],
+                         other.rest)
 
     def unifyWith(self, other, env):
         if isinstance(other, Var) or isinstance(other, Func):
             return other.unifyWith(self, env)
-        if isinstance(other, List):
-            temp1 = self.first
-            temp2 = other.first
-            while temp1 and temp2:
-                if not temp1.val.unifyWith(temp2.val, env):
-                    return False
-                if temp1 is self.last:
-                    temp1 = None
-                if temp2 is other.last:
-                    temp2 = None
-                if temp1:
-                    temp1 = temp1.next
-                if temp2:
-                    temp2 = temp2.next
-            if temp1:
-                new_self = self.__class__.__new__(self.__class__)
-                new_self.first = temp1
-                new_self.last = self.last
-                new_self.rest = self.rest
-                return other.rest and other.rest.unifyWith(new_self, env)
-            if temp2:
-                new_other = other.__class__.__new__(other.__class__)
-                new_other.first = temp2
-                new_other.last = other.last
-                new_other.rest = other.rest
-                return self.rest and self.rest.unifyWith(new_other, env)
-            return self.rest.unifyWith(other.rest, env)
-        return False
+        if not isinstance(other, List):
+            return False
+        a, i, b, j = self, self.start, other, other.start
+        while True:
+            if i == len(a.items):
+                rest = a.rest
+                if isinstance(rest, Var):
+                    rest = rest.applyEnv(env)
+                if isinstance(rest, List):
+                    a, i = rest, rest.start
+                    continue
+                return rest.unifyWith(listFrom(b, j), env)
+            if j == len(b.items):
+                rest = b.rest
+                if isinstance(rest, Var):
+                    rest = rest.applyEnv(env)
+                if isinstance(rest, List):
+                    b, j = rest, rest.start
+                    continue
+                return rest.unifyWith(listFrom(a, i), env)
+            if not a.items[i].unifyWith(b.items[j], env):
+                return False
+            i += 1
+            j += 1
 
     def applyEnv(self, env):
-        first = Node(self.first.val.applyEnv(env))
-        temp = first
-        if self.first is not self.last:
-            p = self.first.next
-            while p:
-                temp = temp.add(p.val.applyEnv(env))
-                if p is self.last:
+        if self.ground:
+            return self
+        items = []
+        changed = False
+        l = self
+        while True:
+            for val in l.values():
+                new = val.applyEnv(env)
+                changed = changed or new is not val
+                items.append(new)
+            rest = l.rest
+            while isinstance(rest, Var):
+                bound = rest.ref if rest.ref is not None else env.get(rest.id)
+                if bound is None:
                     break
-                p = p.next
-        res = self.__class__.__new__(self.__class__)
-        res.first = first
-        res.last = temp
-        res.rest = self.rest.applyEnv(env)
-        if isinstance(res.rest, List):
-            res.last.next = res.rest.first
-            res.rest.first.prev = res.last
-            res.last = res.rest.last
-            res.rest = res.rest.rest
-        return res
-
-
-var_id = 0
+                rest = bound
+                changed = True
+            if not isinstance(rest, List):
+                break
+            l = rest
+        if not changed:
+            return self
+        return buildList(items, rest.applyEnv(env))
 
 
 class IntVar(Var):
+    __slots__ = ()
+
     def __init__(self):
-        global var_id
-        self.id = var_id
-        var_id += 1
+        self.ref = None
+        self.id = next(varIds)
 
     def __repr__(self):
         return '_G' + str(self.id)
 
 
 class Result(object):
-    def __init__(self, data):
-        self.data = data
+    def __init__(self, data, names, valueOf=None):
+        self.cached = data
+        self.names = names
+        self.valueOf = valueOf
+        self.values = {}
+
+    @property
+    def data(self):
+        if self.cached is None:
+            self.cached = collapseAliases(self.names, self.value)
+        return self.cached
+
+    def value(self, var):
+        if var.id not in self.values:
+            self.values[var.id] = self.valueOf(var)
+        return self.values[var.id]
+
+    def freeze(self):
+        if self.cached is None:
+            for var in self.names.values():
+                self.value(var)
+            self.valueOf = None
 
     def __repr__(self):
-        return '{' + ', '.join([repr(k) + ' = ' + repr(v) for k, v in self.data.items()]) + '}'
+        return '{' + ', '.join([repr(self.names[k]) + ' = ' + repr(v) for k, v in self.data.items()]) + '}'
 
     def __getitem__(self, var):
-        return toPythonArg(self.data[Key(var)])
+        if self.cached is None and var.id in self.names:
+            val = self.value(var)
+            if not isinstance(val, Var):
+                return toPythonArg(val)
+        return toPythonArg(self.data[var.id])
 
     def __contains__(self, var):
-        return Key(var) in self.data
+        if self.cached is None and var.id in self.names:
+            if not isinstance(self.value(var), Var):
+                return True
+        return var.id in self.data
+
+
+class FinalEnv(dict):
+    pass
 
 
 class State(object):
-    def __init__(self, term, env, prev):
+    exhausted = False
+
+    def __init__(self, term, env, prev, index=0):
         self.env = env
+        self.index = index
         if isinstance(term, Term):
             self.gen = term.applyEnv(env).query()
         elif isinstance(term, Terms):
@@ -754,28 +2440,32 @@ class State(object):
 
     def generate(self):
         try:
-            return joinEnv(self.env, next(self.gen))
+            res = next(self.gen)
         except StopIteration:
             return None
+        if type(res) is FinalEnv:
+            self.exhausted = True
+            env = FinalEnv(self.env) if self.prev is None else self.env.copy()
+        else:
+            env = self.env.copy()
+        env.update(res)
+        return env
 
 
-def variables_list(term, env):
-    if isinstance(term, Var) and not term.name.startswith('_'):
-        env.append(term)
+def variables_list(term, env, internal=False):
+    if isinstance(term, Var):
+        if internal or not isinstance(term, IntVar) and not term.name.startswith('_'):
+            env.append(term)
     elif isinstance(term, Terms):
         for t in term:
-            variables_list(t, env)
+            variables_list(t, env, internal)
     elif isinstance(term, Term):
         for t in term.args:
-            variables_list(t, env)
+            variables_list(t, env, internal)
     elif isinstance(term, List):
-        temp = term.first
-        while temp:
-            variables_list(temp.val, env)
-            if temp is term.last:
-                break
-            temp = temp.next
-        variables_list(term.rest, env)
+        for val in term.values():
+            variables_list(val, env, internal)
+        variables_list(term.rest, env, internal)
 
 
 def toPythonArg(arg):
@@ -788,23 +2478,1141 @@ def toPythonArg(arg):
     return arg
 
 
-def query(x):
+def queryNames(x):
+    l = []
+    variables_list(x, l)
+    names = OrderedDict()
+    for var in l:
+        if var.id not in names:
+            names[var.id] = var
+    return names
+
+
+def valueReader(names, variables):
+    inverse = dict((names[key].id, var) for key, var in variables.items() if key in names)
+    return lambda var: names.get(var.id, var).applyEnv(inverse)
+
+
+def makeResult(names, valueOf):
+    return Result(None, names, valueOf)
+
+
+def frozenResult(names, valueOf):
+    result = makeResult(names, valueOf)
+    result.freeze()
+    return result
+
+
+def collapseAliases(names, valueOf):
+    res = OrderedDict()
+    for key, var in names.items():
+        res[key] = valueOf(var)
+    rev = defaultdict(list)
+    for key in res:
+        if isinstance(res[key], Var):
+            rev[res[key].id].append(names[key])
+    for l in rev.values():
+        for i in range(1, len(l)):
+            res[l[i - 1].id] = l[i]
+        del res[l[len(l) - 1].id]
+    return res
+
+
+def projector(project):
+    if isinstance(project, Var):
+        return lambda valueOf: toPythonArg(valueOf(project))
+    project = list(project)
+    return lambda valueOf: tuple(toPythonArg(valueOf(var)) for var in project)
+
+
+def envQuery(x, project=None):
+    if project is not None:
+        values = projector(project)
+        for env in x.query():
+            yield values(lambda var: var.applyEnv(env))
+        return
+    names = queryNames(x)
     for env in x.query():
+        yield makeResult(names, lambda var, env=env: var.applyEnv(env))
+
+
+class PredicateStats(object):
+    __slots__ = ('calls', 'redos', 'exits', 'attempts', 'unifications',
+                 'total', 'own', 'active')
+
+    def __init__(self):
+        self.calls = self.redos = self.exits = 0
+        self.attempts = self.unifications = 0
+        self.total = self.own = 0.0
+        self.active = 0
+
+
+class Profiler(object):
+    columns = ('calls', 'redos', 'exits', 'attempts', 'unifications', 'total', 'own')
+
+    def __init__(self):
+        self.stats = defaultdict(PredicateStats)
+        self.frames = []
+
+    def __enter__(self):
+        self.previous = activeProfiler()
+        local.profiler = self
+        return self
+
+    def __exit__(self, *args):
+        local.profiler = self.previous
+
+    def query(self, goal):
+        stats = self.stats[(goal.functor, len(goal.args))]
+        stats.calls += 1
+        gen = goal.solutions(stats)
+        redo = False
+        while True:
+            if redo:
+                stats.redos += 1
+            self.enter(stats)
+            try:
+                res = next(gen, None)
+            finally:
+                self.leave(stats)
+            if res is None:
+                return
+            stats.exits += 1
+            yield res
+            redo = True
+
+    def enter(self, stats):
+        stats.active += 1
+        self.frames.append([time.perf_counter(), 0.0])
+
+    def leave(self, stats):
+        start, children = self.frames.pop()
+        elapsed = time.perf_counter() - start
+        stats.active -= 1
+        stats.own += elapsed - children
+        if not stats.active:
+            stats.total += elapsed
+        if self.frames:
+            self.frames[-1][1] += elapsed
+
+    def rows(self):
+        rows = []
+        for (functor, arity), stats in self.stats.items():
+            name = getattr(functor, '__name__', str(functor)) + '/' + str(arity)
+            rows.append(dict([('predicate', name)] +
+                             [(column, getattr(stats, column)) for column in self.columns]))
+        rows.sort(key=lambda row: row['total'], reverse=True)
+        return rows
+
+    def table(self):
+        rows = self.rows()
+        width = max([len('predicate')] + [len(row['predicate']) for row in rows])
+        lines = ['predicate'.ljust(width) + ''.join(column.rjust(14) for column in self.columns)]
+        for row in rows:
+            cells = [('%.6f' % row[column]) if isinstance(row[column], float)
+                     else str(row[column]) for column in self.columns]
+            lines.append(row['predicate'].ljust(width) + ''.join(cell.rjust(14) for cell in cells))
+        return '\n'.join(lines)
+
+    def json(self):
+        return json.dumps(self.rows(), indent=2)
+
+
+def profile():
+    return Profiler()
+
+
+def deref(term):
+    while isinstance(term, Var) and term.ref is not None:
+        term = term.ref
+    return term
+
+
+FAIL = object()
+
+
+trailAll = float('inf')
+
+
+class Choice(object):
+    __slots__ = ('goal', 'goals', 'mark', 'depth', 'level', 'clauses', 'pos', 'gen', 'floor',
+                 'keys', 'end', 'seen', 'owner', 'frame')
+
+    def __init__(self, goal, goals, mark, depth, level, clauses=None, gen=None):
+        self.goal = goal
+        self.goals = goals
+        self.mark = mark
+        self.depth = depth
+        self.level = level
+        self.clauses = clauses
+        self.pos = 0
+        self.gen = gen
+        self.keys = None
+        self.end = len(clauses) if clauses is not None else 0
+        self.seen = generation
+
+
+class Pending(Exception):
+    def __init__(self, key, func):
+        Exception.__init__(self, func)
+        self.key = key
+        self.func = func
+
+
+class PendingTable(Pending):
+    pass
+
+
+class Branch(Exception):
+    def __init__(self, count):
+        Exception.__init__(self, count)
+        self.count = count
+
+
+class TrailEngine(object):
+    def __init__(self, oracle=None, probe=False):
+        self.trail = []
+        self.choices = []
+        self.oracle = list(reversed(oracle)) if oracle or probe else None
+        self.probe = probe
+        self.negating = 0
+        self.awaiting = False
+        self.resolved = {}
+        self.floor = trailAll if probe else 0
+
+    def query(self, x, project=None):
+        names = {}
+        goal = Term().unique(names, x)
+        variables = queryNames(x)
+        valueOf = valueReader(names, variables)
+        if project is not None:
+            values = projector(project)
+            for _ in self.solve([goal]):
+                yield values(valueOf)
+            return
+        for _ in self.solve([goal]):
+            yield frozenResult(variables, valueOf)
+
+    def solve(self, terms, level=0):
+        base = len(self.choices)
+        goals = None
+        for term in reversed(terms):
+            goals = (term, base, level, goals)
+        return self.run(goals, base)
+
+    def resolve(self, goal, clauses):
+        base = len(self.choices)
+        choice = Choice(goal, None, len(self.trail), base, 0, clauses=clauses)
+        narrow(choice)
+        self.push(choice)
+        return self.run(self.resume(choice), base)
+
+    def run(self, goals, base):
+        if goals is FAIL:
+            goals = self.retry(base)
+            if goals is FAIL:
+                return
+        while True:
+            if goals is None:
+                yield True
+                goals = self.retry(base)
+            else:
+                goals = self.step(goals)
+                if goals is FAIL:
+                    goals = self.retry(base)
+            if goals is FAIL:
+                return
+
+    def drive(self, goals, tick):
+        retrying = goals is FAIL
+        steps = 0
+        while True:
+            if not retrying and goals is None:
+                yield True
+                retrying = True
+                continue
+            mark = len(self.trail)
+            depth = len(self.choices)
+            try:
+                goals = self.retry(0) if retrying else self.step(goals)
+            except Pending as pending:
+                if not retrying:
+                    self.cutTo(depth)
+                self.undo(mark)
+                yield pending
+                continue
+            if goals is FAIL:
+                if retrying:
+                    return
+                retrying = True
+            else:
+                retrying = False
+            steps += 1
+            if steps % tick == 0:
+                yield None
+
+    def step(self, goals):
+        goal, depth, level, goals = goals
+        if isinstance(goal, Terms):
+            if goal.inverted:
+                return self.negate(goal, goals, level)
+            for term in reversed(goal):
+                goals = (term, depth, level, goals)
+            return goals
+        if isinstance(goal, Cut):
+            self.cutTo(depth)
+            return goals
+        if self.awaiting and isinstance(goal, AsyncFunc):
+            self.evaluate(goal)
+            return goals
+        if self.probe and sideEffecting(goal):
+            raise Branch(0)
+        mark = len(self.trail)
+        if isinstance(goal, Eq):
+            return goals if self.unify(goal.args[0], goal.args[1]) else FAIL
+        if isinstance(goal, NE):
+            floor, self.floor = self.floor, trailAll
+            unified = self.unify(goal.args[0], goal.args[1])
+            self.undo(mark)
+            self.floor = floor
+            return FAIL if unified else goals
+        if type(goal).query is Func.query:
+            self.call(goal)
+            return goals
+        if type(goal).query is BoolFunc.query:
+            return goals if self.call(goal) else FAIL
+        shallow = self.oracle is not None and not self.choices and not self.negating
+        if type(goal).query is not Term.query:
+            goal = goal.applyEnv({})
+            choice = Choice(goal, goals, mark, len(self.choices), level,
+                            gen=goal.query())
+        else:
+            if self.awaiting and goal.tabled:
+                clauses = self.tableAnswers(goal)
+            else:
+                clauses = candidateClauses(goal, self)
+            if shallow and len(clauses) > 1:
+                clauses = self.follow(clauses, goals)
+            choice = Choice(goal, goals, mark, len(self.choices), level,
+                            clauses=clauses)
+            narrow(choice)
+        self.push(choice)
+        return self.resume(choice)
+
+    def tableEngine(self):
+        return TrailEngine()
+
+    def tableAnswers(self, goal):
+        key = (Table, variantKey(goal, {}))
+        clauses = self.resolved.pop(key, None)
+        if clauses is not None:
+            return clauses
+        if not currentKb().tables.ready(goal):
+            raise PendingTable(key, goal.applyEnv({}))
+        return candidateClauses(goal, self)
+
+    def push(self, choice):
+        choice.floor = self.floor
+        self.floor = next(varIds)
+        self.choices.append(choice)
+
+    def pop(self):
+        self.floor = self.choices.pop().floor
+
+    def cutTo(self, depth):
+        if depth < len(self.choices):
+            self.floor = self.choices[depth].floor
+            del self.choices[depth:]
+
+    def follow(self, clauses, goals):
+        if self.oracle:
+            return [clauses[self.oracle.pop()]]
+        if self.probe:
+            raise Branch(len(clauses) if splittable(clauses, goals) else 0)
+        self.oracle = None
+        return clauses
+
+    def resume(self, choice):
+        if choice.gen is not None:
+            for env in choice.gen:
+                if env and not self.unifyEnv(choice.goal, env):
+                    self.undo(choice.mark)
+                    continue
+                return choice.goals
+            self.pop()
+            return FAIL
+        goal, clauses, keys, end = choice.goal, choice.clauses, choice.keys, choice.end
+        if choice.pos >= end:
+            self.pop()
+            return FAIL
+        while True:
+            pos = choice.pos
+            clause = clauses[pos]
+            if keys is None:
+                choice.pos = pos + 1
+            else:
+                choice.pos = nextCandidate(clauses, pos + 1, end, keys, choice.seen)
+            last = choice.pos >= end
+            if last:
+                self.pop()
+            if clause.erased is not None and clause.erased <= choice.seen:
+                if last:
+                    return FAIL
+                continue
+            frame = [None] * clause.size
+            try:
+                matched = self.unifyHead(goal, clause.template, frame)
+            except Pending:
+                choice.pos = pos
+                self.undo(choice.mark)
+                if last:
+                    self.push(choice)
+                raise
+            if matched:
+                goals = choice.goals
+                if clause.bodyTemplate is not None:
+                    rights = clause.bodyTemplate.build(frame)
+                    if rights.inverted:
+                        goals = (rights, choice.depth, choice.level + 1, goals)
+                    else:
+                        for term in reversed(rights):
+                            goals = (term, choice.depth, choice.level + 1, goals)
+                return goals
+            self.undo(choice.mark)
+            if last:
+                return FAIL
+
+    def retry(self, base):
+        while len(self.choices) > base:
+            choice = self.choices[-1]
+            self.undo(choice.mark)
+            goals = self.resume(choice)
+            if goals is not FAIL:
+                return goals
+        return FAIL
+
+    def negate(self, terms, goals, level):
+        mark = len(self.trail)
+        base = len(self.choices)
+        floor, self.floor = self.floor, trailAll
+        self.negating += 1
+        try:
+            for _ in self.solve(list(terms), level):
+                return FAIL
+        finally:
+            self.cutTo(base)
+            self.negating -= 1
+            self.undo(mark)
+            self.floor = floor
+        return goals
+
+    def unifyEnv(self, goal, env):
         l = []
-        variables_list(x, l)
-        res = OrderedDict()
+        variables_list(goal, l, True)
         for var in l:
-            if Key(var) not in res:
-                res[Key(var)] = var.applyEnv(env)
-        rev = defaultdict(list)
-        for key in res:
-            if isinstance(res[key], Var):
-                rev[Key(res[key])].append(key.var)
-        for l in rev.values():
-            for i in range(1, len(l)):
-                res[Key(l[i - 1])] = l[i]
-            del res[Key(l[len(l) - 1])]
-        yield Result(res)
+            if var.id in env and not self.unify(var, var.applyEnv(env)):
+                return False
+        return True
+
+    def bind(self, var, value):
+        var.ref = value
+        if var.id < self.floor:
+            self.trail.append(var)
+
+    def undo(self, mark):
+        trail = self.trail
+        while len(trail) > mark:
+            trail.pop().ref = None
+
+    def evaluate(self, func):
+        func = func.applyEnv({})
+        if self.awaiting:
+            func = self.settle(func)
+            if not isinstance(func, Func):
+                return func
+        return fromPythonArg(func.eval())
+
+    def call(self, func):
+        func = func.applyEnv({})
+        if self.awaiting:
+            func = self.settle(func)
+        return func.eval()
+
+    def settle(self, func):
+        for i, arg in enumerate(func.args):
+            if isinstance(arg, Func):
+                func.args[i] = self.settle(arg)
+        if isinstance(func, AsyncFunc):
+            key = variantKey(func, {})
+            if key not in self.resolved:
+                raise Pending(key, func)
+            return self.resolved[key]
+        return func
+
+    def unify(self, a, b):
+        stack = [(a, b)]
+        while stack:
+            a, b = stack.pop()
+            a = deref(a)
+            b = deref(b)
+            if a is b:
+                continue
+            if isinstance(a, Func):
+                stack.append((self.evaluate(a), b))
+            elif isinstance(b, Func):
+                stack.append((a, self.evaluate(b)))
+            elif isinstance(a, Var):
+                if isinstance(b, Var) and b.id > a.id:
+                    self.bind(b, a)
+                else:
+                    self.bind(a, b)
+            elif isinstance(b, Var):
+                self.bind(b, a)
+            elif isinstance(a, List):
+                if not isinstance(b, List) or not self.unifyLists(a, b, stack):
+                    return False
+            elif isinstance(a, Const) or isinstance(b, Const):
+                if not (isinstance(a, Const) and isinstance(b, Const) and
+                        a.functor == b.functor):
+                    return False
+            elif (isinstance(b, Term) and a.functor == b.functor and
+                  len(a.args) == len(b.args)):
+                for i in range(len(a.args) - 1, -1, -1):
+                    stack.append((a.args[i], b.args[i]))
+            else:
+                return False
+        return True
+
+    def unifyHead(self, goal, template, frame):
+        if isinstance(template, GroundTemplate):
+            return self.unify(goal, template.term)
+        stack = []
+        for i in range(len(goal.args) - 1, -1, -1):
+            stack.append((template.args[i], goal.args[i]))
+        while stack:
+            t, term = stack.pop()
+            term = deref(term)
+            if isinstance(term, Func):
+                term = self.evaluate(term)
+            if isinstance(t, Slot):
+                if frame[t.index] is None:
+                    frame[t.index] = term
+                elif not self.unify(frame[t.index], term):
+                    return False
+            elif isinstance(t, GroundTemplate):
+                if not self.unify(t.term, term):
+                    return False
+            elif isinstance(t, TermTemplate) and t.isFunc:
+                if not self.unify(t.build(frame), term):
+                    return False
+            elif isinstance(term, Var):
+                self.bind(term, t.build(frame))
+            elif isinstance(t, ListTemplate):
+                if not isinstance(term, List):
+                    return False
+                self.matchList(t, term, frame, stack)
+            elif (isinstance(term, Term) and not isinstance(term, Const) and
+                  t.functor == term.functor and len(t.args) == len(term.args)):
+                for i in range(len(t.args) - 1, -1, -1):
+                    stack.append((t.args[i], term.args[i]))
+            else:
+                return False
+        return True
+
+    def matchList(self, t, term, frame, stack):
+        pairs = []
+        items = t.items
+        i = 0
+        l, j = term, term.start
+        while i < len(items):
+            if j == len(l.items):
+                rest = deref(l.rest)
+                if not isinstance(rest, List):
+                    break
+                l, j = rest, rest.start
+            pairs.append((items[i], l.items[j]))
+            i += 1
+            j += 1
+        if i < len(items):
+            tail = ListTemplate(items[i:], t.rest)
+        else:
+            tail = t.rest
+        pairs.append((tail, listFrom(l, j)))
+        stack.extend(reversed(pairs))
+
+    def unifyLists(self, a, b, stack):
+        i, j = a.start, b.start
+        while True:
+            if i == len(a.items):
+                rest = deref(a.rest)
+                if isinstance(rest, List):
+                    a, i = rest, rest.start
+                    continue
+                stack.append((rest, listFrom(b, j)))
+                return True
+            if j == len(b.items):
+                rest = deref(b.rest)
+                if isinstance(rest, List):
+                    b, j = rest, rest.start
+                    continue
+                stack.append((listFrom(a, i), rest))
+                return True
+            x = a.items[i]
+            y = b.items[j]
+            if x is not y:
+                if isinstance(x, Const) and isinstance(y, Const):
+                    if x.functor != y.functor:
+                        return False
+                elif not self.unify(x, y):
+                    return False
+            i += 1
+            j += 1
+
+
+class BudgetExceeded(Exception):
+    def __init__(self, reason, counters):
+        Exception.__init__(self, 'Query exceeded ' + reason + ': ' + repr(counters))
+        self.reason = reason
+        self.counters = counters
+
+
+class QueryTimeout(BudgetExceeded, TimeoutError):
+    pass
+
+
+class BudgetEngine(TrailEngine):
+    clockInterval = 64
+
+    def __init__(self, maxSteps=None, timeout=None, maxDepth=None, oracle=None, probe=False):
+        TrailEngine.__init__(self, oracle, probe)
+        self.maxSteps = maxSteps
+        self.maxDepth = maxDepth
+        self.timeout = timeout
+        self.started = time.monotonic()
+        self.deadline = None if timeout is None else self.started + timeout
+        self.steps = 0
+        self.unifications = 0
+        self.depth = 0
+        self.level = 0
+        self.cancelled = False
+
+    def counters(self):
+        return {'steps': self.steps, 'unifications': self.unifications,
+                'depth': self.depth, 'elapsed': time.monotonic() - self.started}
+
+    def abort(self, reason):
+        if reason == 'timeout':
+            raise QueryTimeout(reason, self.counters())
+        raise BudgetExceeded(reason, self.counters())
+
+    def step(self, goals):
+        self.charge(goals[2])
+        return TrailEngine.step(self, goals)
+
+    def charge(self, level):
+        if self.cancelled:
+            self.abort('cancelled')
+        self.steps += 1
+        self.level = level
+        if level > self.depth:
+            self.depth = level
+            if self.maxDepth is not None and level > self.maxDepth:
+                self.abort('max_depth')
+        if self.maxSteps is not None and self.steps > self.maxSteps:
+            self.abort('max_steps')
+        if self.deadline is not None and self.steps % self.clockInterval == 0:
+            self.checkClock()
+
+    def checkClock(self):
+        if time.monotonic() >= self.deadline:
+            self.abort('timeout')
+
+    def unifyHead(self, goal, template, frame):
+        self.unifications += 1
+        return TrailEngine.unifyHead(self, goal, template, frame)
+
+    def tableEngine(self):
+        return SubgoalEngine(self, self.level + 1)
+
+
+class SubgoalEngine(TrailEngine):
+    def __init__(self, budget, level):
+        TrailEngine.__init__(self)
+        self.budget = budget
+        self.level = level
+
+    def step(self, goals):
+        self.budget.charge(self.level + goals[2])
+        return TrailEngine.step(self, goals)
+
+    def unifyHead(self, goal, template, frame):
+        self.budget.unifications += 1
+        return TrailEngine.unifyHead(self, goal, template, frame)
+
+    def tableEngine(self):
+        return SubgoalEngine(self.budget, self.budget.level + 1)
+
+
+class ProfileFrame(object):
+    __slots__ = ('stats', 'parent', 'open', 'exited')
+
+    def __init__(self, stats, parent):
+        self.stats = stats
+        self.parent = parent
+        self.exited = False
+        if parent is None:
+            self.open = frozenset([stats])
+        elif stats in parent.open:
+            self.open = parent.open
+        else:
+            self.open = parent.open | frozenset([stats])
+
+
+class ProfileExit(object):
+    __slots__ = ('frame',)
+
+    def __init__(self, frame):
+        self.frame = frame
+
+
+class ProfileEngine(TrailEngine):
+    def __init__(self, profiler):
+        TrailEngine.__init__(self)
+        self.profiler = profiler
+        self.owner = None
+        self.calling = None
+        self.current = None
+        self.root = None
+        self.clock = time.perf_counter()
+
+    def tick(self, frame):
+        now = time.perf_counter()
+        elapsed = now - self.clock
+        self.clock = now
+        if frame is not None:
+            frame.stats.own += elapsed
+            for stats in frame.open:
+                stats.total += elapsed
+
+    def step(self, goals):
+        self.tick(self.owner)
+        goal = goals[0]
+        if type(goal) is ProfileExit:
+            goal.frame.stats.exits += 1
+            goal.frame.exited = True
+            self.owner = goal.frame.parent
+            return goals[3]
+        return TrailEngine.step(self, goals)
+
+    def push(self, choice):
+        choice.owner = self.owner
+        choice.frame = None
+        self.calling = choice
+        TrailEngine.push(self, choice)
+
+    def resume(self, choice):
+        self.tick(self.owner)
+        calling = self.calling is choice
+        self.calling = None
+        if not calling:
+            self.redo(choice.frame if choice.frame is not None else choice.owner)
+        self.owner = choice.owner
+        if choice.gen is not None:
+            return TrailEngine.resume(self, choice)
+        goal = choice.goal
+        stats = self.profiler.stats[(goal.functor, len(goal.args))]
+        if calling:
+            stats.calls += 1
+        frame = choice.frame = ProfileFrame(stats, choice.owner)
+        if choice.owner is None:
+            self.root = frame
+        self.current = stats
+        goals = TrailEngine.resume(self, choice)
+        self.tick(frame)
+        if goals is FAIL:
+            return FAIL
+        if goals is choice.goals:
+            stats.exits += 1
+            frame.exited = True
+            return goals
+        body = []
+        while goals is not choice.goals:
+            body.append(goals[:3])
+            goals = goals[3]
+        goals = (ProfileExit(frame), choice.depth, choice.level + 1, goals)
+        for term, depth, level in reversed(body):
+            goals = (term, depth, level, goals)
+        self.owner = frame
+        return goals
+
+    def solve(self, terms, level=0):
+        answers = TrailEngine.solve(self, terms, level)
+        if len(terms) != 1 or not isinstance(terms[0], Term):
+            return answers
+        return self.solveGoal(answers, len(self.choices))
+
+    def solveGoal(self, answers, base):
+        for answer in answers:
+            yield answer
+            if len(self.choices) == base:
+                self.redo(self.root)
+
+    def redo(self, frame):
+        while frame is not None and frame.exited:
+            frame.exited = False
+            frame.stats.redos += 1
+            frame = frame.parent
+
+    def negate(self, terms, goals, level):
+        owner = self.owner
+        try:
+            return TrailEngine.negate(self, terms, goals, level)
+        finally:
+            self.owner = owner
+
+    def unifyHead(self, goal, template, frame):
+        self.current.attempts += 1
+        matched = TrailEngine.unifyHead(self, goal, template, frame)
+        if matched:
+            self.current.unifications += 1
+        return matched
+
+
+class BoundedQuery(object):
+    def __init__(self, x, maxSteps=None, timeout=None, maxDepth=None, limit=None,
+                 project=None):
+        self.engine = BudgetEngine(maxSteps, timeout, maxDepth)
+        self.results = currentKb().bind(self.engine.query(x, project))
+        if limit is not None:
+            self.results = itertools.islice(self.results, limit)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.results)
+
+    next = __next__
+
+    @property
+    def counters(self):
+        return self.engine.counters()
+
+
+def buildList(items, rest):
+    if not items:
+        return rest
+    res = List.__new__(List)
+    res.items = tuple(items)
+    res.start = 0
+    res.rest = rest
+    res.ground = rest.ground and all(val.ground for val in res.items)
+    return res
+
+
+def listFrom(l, i):
+    if i == len(l.items):
+        return l.rest
+    if i == l.start:
+        return l
+    res = List.__new__(List)
+    res.items = l.items
+    res.start = i
+    res.rest = l.rest
+    res.ground = l.ground
+    return res
+
+
+def hasCut(clauses):
+    if isinstance(clauses, RowSet):
+        return False
+    if isinstance(clauses, SegmentList):
+        return any(hasCut(part) for part in clauses.parts)
+    for clause in clauses:
+        if isinstance(clause, Clause) and clause.body is not None and \
+                not clause.body.inverted and \
+                any(isinstance(term, Cut) for term in clause.body):
+            return True
+    return False
+
+
+def sideEffecting(goal):
+    return type(goal).query is not Term.query and not isinstance(goal, pureBuiltins)
+
+
+def splittable(clauses, goals):
+    if hasCut(clauses):
+        return False
+    while goals is not None:
+        if isinstance(goals[0], Cut):
+            return False
+        goals = goals[3]
+    return True
+
+
+def probeBranch(goal, oracle):
+    engine = BudgetEngine(probeSteps, oracle=oracle, probe=True)
+    try:
+        for _ in engine.solve([goal]):
+            break
+    except Branch as branch:
+        return branch.count
+    except BudgetExceeded:
+        return 0
+    finally:
+        engine.undo(0)
+    return 0
+
+
+def splitBranches(goal, count):
+    frontier = [[]]
+    leaves = []
+    while frontier and len(frontier) + len(leaves) < count:
+        oracle = frontier.pop(0)
+        n = probeBranch(goal, oracle)
+        if n:
+            frontier.extend(oracle + [k] for k in range(n))
+        else:
+            leaves.append(oracle)
+    return sorted(leaves + frontier)
+
+
+def solveBranch(goal, variables, names, oracle, limit, project):
+    results = []
+    valueOf = valueReader(names, variables)
+    values = projector(project) if project is not None else None
+    for _ in TrailEngine(oracle).solve([goal]):
+        if values is not None:
+            results.append(values(valueOf))
+        else:
+            results.append(list(collapseAliases(variables, valueOf).items()))
+        if limit is not None and len(results) >= limit:
+            break
+    return results
+
+
+branchesPerWorker = 4
+pureBuiltins = (Eq, NE, LT, LE, GE, GT)
+probeSteps = 10000
+
+
+def parallelQuery(x, workers, limit=None, project=None):
+    names = {}
+    goal = Term().unique(names, x)
+    variables = queryNames(x)
+    branches = splitBranches(goal, workers * branchesPerWorker)
+    executor, snapshot = processPool(workers)
+    try:
+        futures = [executor.submit(solveBranch, goal, variables, names, oracle, limit, project)
+                   for oracle in branches]
+        count = 0
+        for future in as_completed(futures):
+            for data in future.result():
+                yield data if project is not None else Result(OrderedDict(data), variables)
+                count += 1
+                if limit is not None and count >= limit:
+                    return
+    finally:
+        closePool(executor, snapshot)
+
+
+def processPool(workers):
+    if 'fork' in multiprocessing.get_all_start_methods():
+        executor = ProcessPoolExecutor(workers, multiprocessing.get_context('fork'),
+                                       initializer=useKb, initargs=(currentKb(),))
+        return executor, None
+    fd, snapshot = tempfile.mkstemp(suffix='.kb')
+    os.close(fd)
+    save_kb(snapshot)
+    executor = ProcessPoolExecutor(workers, initializer=load_kb, initargs=(snapshot,))
+    return executor, snapshot
+
+
+def closePool(executor, snapshot):
+    processes = list((getattr(executor, '_processes', None) or {}).values())
+    executor.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+    for process in processes:
+        process.join()
+    if snapshot is not None:
+        try:
+            os.remove(snapshot)
+        except OSError:
+            pass
+
+
+async def asyncQuery(x, base, steps, timeout, limit, maxSteps, maxDepth):
+    loop = asyncio.get_running_loop()
+    deadline = None if timeout is None else loop.time() + timeout
+    engine = BudgetEngine(maxSteps, timeout, maxDepth)
+    engine.awaiting = True
+    engine.floor = trailAll
+    names = {}
+    goal = Term().unique(names, x)
+    variables = queryNames(x)
+    valueOf = valueReader(names, variables)
+    events = engine.drive((goal, 0, 0, None), steps)
+    count = 0
+    try:
+        while limit is None or count < limit:
+            with base:
+                event = next(events, FAIL)
+            if event is FAIL:
+                return
+            if deadline is not None and loop.time() >= deadline:
+                engine.abort('timeout')
+            if event is True:
+                count += 1
+                yield frozenResult(variables, valueOf)
+            elif isinstance(event, PendingTable):
+                value = loop.run_in_executor(None, fillTable, base, event.func, engine)
+                engine.resolved[event.key] = await settleAsync(value, engine, loop, deadline)
+            elif isinstance(event, Pending):
+                value = settleAsync(event.func.evalAsync(), engine, loop, deadline)
+                engine.resolved[event.key] = fromPythonArg(await value)
+            else:
+                await asyncio.sleep(0)
+    finally:
+        engine.cancelled = True
+
+
+async def settleAsync(value, engine, loop, deadline):
+    if deadline is not None:
+        value = asyncio.wait_for(value, deadline - loop.time())
+    try:
+        return await value
+    except asyncio.TimeoutError:
+        engine.abort('timeout')
+
+
+def fillTable(base, goal, engine):
+    with base:
+        return candidateClauses(goal, engine)
+
+
+def aquery(x, steps=1000, timeout=None, limit=None, max_steps=None, max_depth=None):
+    return asyncQuery(x, currentKb(), steps, timeout, limit, max_steps, max_depth)
+
+
+def query(x, engine=None, workers=None, limit=None,
+          max_steps=None, timeout=None, max_depth=None, project=None):
+    budgeted = max_steps is not None or timeout is not None or max_depth is not None
+    if engine is None:
+        engine = 'trail'
+    if engine not in ('env', 'trail'):
+        raise Exception('Unknown engine: ' + repr(engine))
+    if workers:
+        if budgeted:
+            raise Exception('Inference budgets are not supported for parallel queries')
+        return currentKb().bind(parallelQuery(x, workers, limit, project))
+    if budgeted:
+        return BoundedQuery(x, max_steps, timeout, max_depth, limit, project)
+    profiler = activeProfiler()
+    if engine == 'env':
+        results = envQuery(x, project)
+    elif profiler is not None:
+        results = ProfileEngine(profiler).query(x, project)
+    else:
+        results = TrailEngine().query(x, project)
+    if limit is not None:
+        results = itertools.islice(results, limit)
+    return currentKb().bind(results)
+
+
+def batchProcedure(base, procedures, goal):
+    if not isinstance(goal, Term) or goal.tabled or type(goal).query is not Term.query:
+        return None
+    key = (goal.functor, len(goal.args))
+    if key not in procedures:
+        procedure = base.get(key)
+        if procedure is not None and procedure.factTables:
+            procedure = None
+        procedures[key] = (procedure, {})
+    return procedures[key]
+
+
+def solveMany(goals, engine=None, project=None, limit=None):
+    if engine is None:
+        engine = 'trail'
+    base = currentKb()
+    values = projector(project) if project is not None else None
+    procedures = {}
+    solver = TrailEngine()
+    answers = []
+    for x in goals:
+        shared = batchProcedure(base, procedures, x) \
+            if engine == 'trail' and activeProfiler() is None else None
+        if shared is None or shared[0] is None:
+            answers.append(list(query(x, engine=engine, limit=limit, project=project)))
+            continue
+        procedure, candidates = shared
+        names = {}
+        goal = Term().unique(names, x)
+        variables = queryNames(x)
+        valueOf = valueReader(names, variables)
+        mode = tuple(indexKey(deref(arg)) for arg in goal.args)
+        if mode not in candidates:
+            candidates[mode] = procedure.candidates(goal)
+        solver.floor = trailAll
+        results = solver.resolve(goal, candidates[mode])
+        if limit is not None:
+            results = itertools.islice(results, limit)
+        rows = []
+        try:
+            if values is not None:
+                for _ in results:
+                    rows.append(values(valueOf))
+            else:
+                for _ in results:
+                    rows.append(frozenResult(variables, valueOf))
+        finally:
+            solver.undo(0)
+            del solver.choices[:]
+        answers.append(rows)
+    return answers
+
+
+def solveChunk(goals, engine, project, limit):
+    answers = solveMany(goals, engine, project, limit)
+    if project is not None:
+        return answers
+    return [[list(result.data.items()) for result in rows] for rows in answers]
+
+
+def query_many(goals, engine=None, project=None, limit=None, workers=None,
+               processes=False):
+    goals = list(goals)
+    if not workers or len(goals) < 2:
+        return solveMany(goals, engine, project, limit)
+    size = max(1, -(-len(goals) // (workers * branchesPerWorker)))
+    chunks = [goals[i:i + size] for i in range(0, len(goals), size)]
+    answers = []
+    if not processes:
+        with ThreadPoolExecutor(workers, initializer=useKb,
+                                initargs=(currentKb(),)) as executor:
+            for rows in executor.map(solveMany, chunks, itertools.repeat(engine),
+                                     itertools.repeat(project), itertools.repeat(limit)):
+                answers.extend(rows)
+        return answers
+    executor, snapshot = processPool(workers)
+    try:
+        futures = [executor.submit(solveChunk, chunk, engine, project, limit)
+                   for chunk in chunks]
+        for chunk, future in zip(chunks, futures):
+            for x, rows in zip(chunk, future.result()):
+                if project is None:
+                    variables = queryNames(x)
+                    rows = [Result(OrderedDict(data), variables) for data in rows]
+                answers.append(rows)
+    finally:
+        closePool(executor, snapshot)
+    return answers
+
+
+def solve_batch(pred, rows, **kwargs):
+    return query_many([pred(*row) for row in rows], **kwargs)
 
 
 class ObjectType(type):
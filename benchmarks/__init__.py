@@ -0,0 +1 @@
+WORKLOADS = ['nrev', 'queens', 'zebra', 'river', 'join', 'recursion']
@@ -0,0 +1,33 @@
+import argparse
+import importlib
+import json
+
+from benchmarks import WORKLOADS
+from benchmarks.harness import format_table, measure, measure_plain
+
+
+def main():
+    parser = argparse.ArgumentParser(description='LogicAPI benchmarks')
+    parser.add_argument('workloads', nargs='*', default=WORKLOADS)
+    parser.add_argument('--engine', choices=['env', 'trail', 'all'], default='all')
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    rows = []
+    for name in args.workloads:
+        module = importlib.import_module('benchmarks.' + name)
+        base, goal = module.setup()
+        for engine in module.engines:
+            if args.engine in ('all', engine):
+                rows.append(measure(name, base, goal, engine, module.repeat))
+        if hasattr(module, 'plain'):
+            rows.append(measure_plain(name, 'python', module.plain, module.repeat))
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    else:
+        print(format_table(rows))
+
+
+if __name__ == '__main__':
+    main()
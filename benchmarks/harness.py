@@ -0,0 +1,73 @@
+import gc
+import time
+import tracemalloc
+
+from LogicAPI import BudgetEngine
+
+
+def count_inferences(base, goal):
+    engine = BudgetEngine()
+    with base:
+        answers = sum(1 for _ in engine.query(goal))
+    return engine.steps, answers
+
+
+def timed(run, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        run()
+    return (time.perf_counter() - start) / repeat
+
+
+def memory(run):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    ignore = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    stats = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), 'filename')
+    return peak, sum(stat.count_diff for stat in stats if stat.count_diff > 0)
+
+
+def measure(name, base, goal, engine, repeat):
+    def run():
+        for _ in base.query(goal, engine=engine):
+            pass
+
+    inferences, answers = count_inferences(base, goal)
+    seconds = timed(run, repeat)
+    peak, retained = memory(run)
+    return {'benchmark': name, 'engine': engine, 'answers': answers,
+            'inferences': inferences, 'seconds': seconds,
+            'lips': inferences / seconds, 'peak_bytes': peak,
+            'retained_blocks': retained}
+
+
+def measure_plain(name, engine, run, repeat):
+    seconds = timed(run, repeat)
+    peak, retained = memory(run)
+    return {'benchmark': name, 'engine': engine, 'answers': None,
+            'inferences': None, 'seconds': seconds, 'lips': None,
+            'peak_bytes': peak, 'retained_blocks': retained}
+
+
+def format_table(rows):
+    columns = ['benchmark', 'engine', 'answers', 'inferences', 'seconds',
+               'lips', 'peak_bytes', 'retained_blocks']
+    lines = [''.join(column.rjust(16) for column in columns)]
+    for row in rows:
+        cells = []
+        for column in columns:
+            value = row[column]
+            if value is None:
+                value = '-'
+            elif column == 'seconds':
+                value = '%.6f' % value
+            elif column == 'lips':
+                value = '%.0f' % value
+            cells.append(str(value).rjust(16))
+        lines.append(''.join(cells))
+    return '\n'.join(lines)
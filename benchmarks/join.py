@@ -0,0 +1,30 @@
+from LogicAPI import KnowledgeBase, Term, Var, load_facts
+
+ROWS = 20000
+DEPARTMENTS = 200
+
+I, D, N = Var('I'), Var('D'), Var('N')
+
+engines = ('env', 'trail')
+repeat = 1
+
+
+class employee(Term):
+    pass
+
+
+class department(Term):
+    pass
+
+
+def setup():
+    base = KnowledgeBase()
+    with base:
+        load_facts(employee, ((i, i % DEPARTMENTS) for i in range(ROWS)))
+        load_facts(department, ((d, 'dept%d' % d) for d in range(DEPARTMENTS)))
+    return base, employee(I, D) & department(D, N)
+
+
+def plain():
+    names = dict((d, 'dept%d' % d) for d in range(DEPARTMENTS))
+    return [(i, i % DEPARTMENTS, names[i % DEPARTMENTS]) for i in range(ROWS)]
@@ -0,0 +1,33 @@
+from LogicAPI import KnowledgeBase, Term, Var
+
+X, Y, H, T, L, R = Var('X'), Var('Y'), Var('H'), Var('T'), Var('L'), Var('R')
+
+engines = ('env', 'trail')
+repeat = 20
+
+
+class app(Term):
+    pass
+
+
+class nrev(Term):
+    pass
+
+
+def setup():
+    base = KnowledgeBase()
+    with base:
+        +app([], L, L)
+        app([H] + T, L, [H] + R) <= app(T, L, R)
+
+        +nrev([], [])
+        nrev([H] + T, R) <= nrev(T, Y) & app(Y, [H], R)
+    return base, nrev(list(range(30)), X)
+
+
+def plain():
+    def reverse(l):
+        if not l:
+            return []
+        return reverse(l[1:]) + [l[0]]
+    return reverse(list(range(30)))
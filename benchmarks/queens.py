@@ -0,0 +1,60 @@
+from itertools import permutations
+
+from LogicAPI import KnowledgeBase, Term, Var
+
+N = 6
+
+X, H, T, R, L = Var('X'), Var('H'), Var('T'), Var('R'), Var('L')
+Q, Q1, Qs, D = Var('Q'), Var('Q1'), Var('Qs'), Var('D')
+
+engines = ('env', 'trail')
+repeat = 1
+
+
+class sel(Term):
+    pass
+
+
+class perm(Term):
+    pass
+
+
+class safe(Term):
+    pass
+
+
+class no_attack(Term):
+    pass
+
+
+class queens(Term):
+    pass
+
+
+def setup():
+    base = KnowledgeBase()
+    with base:
+        +sel(X, [X] + T, T)
+        sel(X, [H] + T, [H] + R) <= sel(X, T, R)
+
+        +perm([], [])
+        perm(L, [H] + T) <= sel(H, L, R) & perm(R, T)
+
+        +no_attack(Q, [], D)
+        no_attack(Q, [Q1] + Qs, D) <= (
+            (Q1 - Q != D) &
+            (Q - Q1 != D) &
+            no_attack(Q, Qs, D + 1)
+        )
+
+        +safe([])
+        safe([Q] + Qs) <= no_attack(Q, Qs, 1) & safe(Qs)
+
+        queens(Qs) <= perm(list(range(1, N + 1)), Qs) & safe(Qs)
+    return base, queens(X)
+
+
+def plain():
+    return [p for p in permutations(range(1, N + 1))
+            if all(abs(p[i] - p[j]) != j - i
+                   for i in range(N) for j in range(i + 1, N))]
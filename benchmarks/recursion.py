@@ -0,0 +1,28 @@
+from LogicAPI import KnowledgeBase, Term, Var
+
+DEPTH = 100000
+
+I, N = Var('I'), Var('N')
+
+# The env engine recurses on the Python stack and cannot reach this depth.
+engines = ('trail',)
+repeat = 1
+
+
+class count(Term):
+    pass
+
+
+def setup():
+    base = KnowledgeBase()
+    with base:
+        +count(N, N)
+        count(I, N) <= (I < N) & count(I + 1, N)
+    return base, count(0, DEPTH)
+
+
+def plain():
+    i = 0
+    while i < DEPTH:
+        i += 1
+    return i
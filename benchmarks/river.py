@@ -0,0 +1,107 @@
+from LogicAPI import KnowledgeBase, Term, Var, _
+
+A, B, C, V, P = Var('A'), Var('B'), Var('C'), Var('V'), Var('P')
+F, G, X, Y, Z = Var('F'), Var('G'), Var('X'), Var('Y'), Var('Z')
+T, Action, Plan = Var('T'), Var('Action'), Var('Plan')
+Start, End = Var('Start'), Var('End')
+
+engines = ('env', 'trail')
+repeat = 5
+
+
+class opposite(Term):
+    pass
+
+
+class initial(Term):
+    pass
+
+
+class final(Term):
+    pass
+
+
+class crossing(Term):
+    pass
+
+
+class unsafe(Term):
+    pass
+
+
+class member(Term):
+    pass
+
+
+class river_aux(Term):
+    pass
+
+
+class river(Term):
+    pass
+
+
+def setup():
+    base = KnowledgeBase()
+    with base:
+        +opposite('l', 'r')
+        +opposite('r', 'l')
+
+        +initial(['l', 'l', 'l', 'l'])
+        +final(['r', 'r', 'r', 'r'])
+
+        crossing([F, X, Y, Z], [G, X, Y, Z], 'farmer') <= opposite(F, G)
+        crossing([F, F, Y, Z], [G, G, Y, Z], 'fox') <= opposite(F, G)
+        crossing([F, X, F, Z], [G, X, G, Z], 'goose') <= opposite(F, G)
+        crossing([F, X, Y, F], [G, X, Y, G], 'beans') <= opposite(F, G)
+
+        unsafe([F, X, X, _]) <= (F != X)
+        unsafe([F, _, X, X]) <= (F != X)
+
+        +member(X, [X] + _)
+        member(X, [Y] + T) <= member(X, T)
+
+        +river_aux(A, A, _, [])
+        river_aux(A, B, V, [Action] + Plan) <= (
+            crossing(A, C, Action) &
+            ~unsafe(C) &
+            ~member(C, V) &
+            river_aux(C, B, [C] + V, Plan)
+        )
+
+        river(P) <= (
+            initial(Start) &
+            final(End) &
+            river_aux(Start, End, [Start], P)
+        )
+    return base, river(P)
+
+
+def plain():
+    def moves(state):
+        farmer = state[0]
+        other = 'r' if farmer == 'l' else 'l'
+        for i, action in enumerate(['farmer', 'fox', 'goose', 'beans']):
+            if i and state[i] != farmer:
+                continue
+            new = list(state)
+            new[0] = other
+            new[i] = other
+            yield tuple(new), action
+
+    def unsafe(state):
+        return (state[1] == state[2] != state[0] or
+                state[2] == state[3] != state[0])
+
+    def search(state, end, visited):
+        if state == end:
+            yield []
+            return
+        for new, action in moves(state):
+            if unsafe(new) or new in visited:
+                continue
+            for plan in search(new, end, visited + [new]):
+                yield [action] + plan
+
+    start = ('l', 'l', 'l', 'l')
+    return list(search(start, ('r', 'r', 'r', 'r'), [start]))
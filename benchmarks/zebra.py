@@ -0,0 +1,59 @@
+from LogicAPI import KnowledgeBase, Term, Var, _
+
+X, Y, T, L = Var('X'), Var('Y'), Var('T'), Var('L')
+Owner, Hs = Var('Owner'), Var('Hs')
+
+engines = ('env', 'trail')
+repeat = 1
+
+
+class house(Term):
+    pass
+
+
+class member(Term):
+    pass
+
+
+class right_of(Term):
+    pass
+
+
+class next_to(Term):
+    pass
+
+
+class zebra(Term):
+    pass
+
+
+def setup():
+    base = KnowledgeBase()
+    with base:
+        +member(X, [X] + _)
+        member(X, [_] + T) <= member(X, T)
+
+        +right_of(X, Y, [Y, X] + _)
+        right_of(X, Y, [_] + T) <= right_of(X, Y, T)
+
+        next_to(X, Y, L) <= right_of(X, Y, L)
+        next_to(X, Y, L) <= right_of(Y, X, L)
+
+        zebra(Owner, Hs) <= (
+            (Hs == [house(_, 'norwegian', _, _, _), house('blue', _, _, _, _),
+                    house(_, _, _, 'milk', _), _, _]) &
+            member(house('red', 'english', _, _, _), Hs) &
+            member(house(_, 'spanish', 'dog', _, _), Hs) &
+            member(house('green', _, _, 'coffee', _), Hs) &
+            member(house(_, 'ukrainian', _, 'tea', _), Hs) &
+            right_of(house('green', _, _, _, _), house('ivory', _, _, _, _), Hs) &
+            member(house(_, _, 'snails', _, 'winston'), Hs) &
+            member(house('yellow', _, _, _, 'kools'), Hs) &
+            next_to(house(_, _, _, _, 'chesterfield'), house(_, _, 'fox', _, _), Hs) &
+            next_to(house(_, _, _, _, 'kools'), house(_, _, 'horse', _, _), Hs) &
+            member(house(_, _, _, 'orange juice', 'lucky strike'), Hs) &
+            member(house(_, 'japanese', _, _, 'parliament'), Hs) &
+            member(house(_, _, _, 'water', _), Hs) &
+            member(house(_, Owner, 'zebra', _, _), Hs)
+        )
+    return base, zebra(X, Y)
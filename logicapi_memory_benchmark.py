@@ -0,0 +1,96 @@
+import argparse
+import gc
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+
+parser = argparse.ArgumentParser()
+parser.add_argument('n', nargs='?', type=int, default=100000)
+parser.add_argument('--before', metavar='REV',
+                    help='also measure LogicAPI.py as of this git revision, '
+                         'e.g. the parent of the commit that introduced __slots__')
+parser.add_argument('--path', help=argparse.SUPPRESS)
+parser.add_argument('--json', action='store_true', help=argparse.SUPPRESS)
+args = parser.parse_args()
+
+if args.path:
+    sys.path.insert(0, args.path)
+
+from LogicAPI import Term, Var, query
+
+N = args.n
+
+X, Y = Var('X'), Var('Y')
+
+
+class edge(Term):
+    pass
+
+
+class label(Term):
+    pass
+
+
+def measure(load):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    load()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return float(after - before) / N
+
+
+def load_edges():
+    for i in range(N):
+        +edge(i, i + 1)
+
+
+def load_labels():
+    for i in range(N):
+        +label(i, 'node', [i % 7, 'x'])
+
+
+def measure_answers():
+    tracemalloc.start()
+    try:
+        results = list(query(edge(X, Y), engine='trail'))
+    except TypeError:
+        results = list(query(edge(X, Y)))
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return float(peak) / len(results)
+
+
+def measure_all():
+    return [('edge(int, int)', 'bytes/fact', measure(load_edges)),
+            ('label(int, str, list)', 'bytes/fact', measure(load_labels)),
+            ('edge(X, Y) answers', 'bytes/answer peak', measure_answers())]
+
+
+def measure_revision(rev):
+    root = os.path.dirname(os.path.abspath(__file__))
+    source = subprocess.check_output(['git', 'show', rev + ':LogicAPI.py'], cwd=root)
+    with tempfile.TemporaryDirectory() as path:
+        with open(os.path.join(path, 'LogicAPI.py'), 'wb') as f:
+            f.write(source)
+        output = subprocess.check_output([sys.executable, os.path.abspath(__file__), str(N),
+                                          '--path', path, '--json'])
+    return [tuple(row) for row in json.loads(output.decode())]
+
+
+rows = measure_all()
+if args.json:
+    print(json.dumps(rows))
+elif args.before:
+    before = measure_revision(args.before)
+    print('%-24s %10s %10s' % ('', 'before', 'after'))
+    for (name, unit, old), (_, _, new) in zip(before, rows):
+        print('%-24s %10.1f %10.1f %s' % (name, old, new, unit))
+else:
+    for name, unit, value in rows:
+        print('%-24s %.1f %s' % (name + ':', value, unit))
@@ -0,0 +1,131 @@
+import asyncio
+import threading
+
+import pytest
+
+from LogicAPI import AsyncFunc, Cut, KnowledgeBase, QueryTimeout, Term, Var, aquery
+
+X, Y, Z, H, T, L, R, N, M = [Var(name) for name in 'XYZHTLRNM']
+
+
+class app(Term):
+    pass
+
+
+class member(Term):
+    pass
+
+
+class first(Term):
+    pass
+
+
+class edge(Term):
+    pass
+
+
+class path(Term):
+    tabled = True
+
+
+class nat(Term):
+    tabled = True
+
+
+class double(AsyncFunc):
+    async def function(self, x):
+        await asyncio.sleep(0)
+        return 2 * x
+
+
+class slow(AsyncFunc):
+    async def function(self, x):
+        await asyncio.sleep(10)
+        return x
+
+
+class scaled(Term):
+    pass
+
+
+def program():
+    base = KnowledgeBase()
+    with base:
+        app([], L, L) <= None
+        app([H] + T, L, [H] + R) <= app(T, L, R)
+        member(X, [X] + T) <= None
+        member(X, [H] + T) <= member(X, T)
+        first(X, L) <= member(X, L) & Cut()
+        for a, b in [(1, 2), (2, 3), (3, 1), (3, 4)]:
+            +edge(a, b)
+        path(X, Y) <= path(X, Z) & edge(Z, Y)
+        path(X, Y) <= edge(X, Y)
+        +nat(0)
+        nat(N) <= nat(M) & (N == M + 1)
+        scaled(X, Y) <= member(X, [1, 2, 3]) & (Y == double(X))
+    return base
+
+
+def collect(results):
+    async def run():
+        return [r async for r in results]
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize('goal', [
+    app(X, Y, [1, 2, 3]),
+    first(X, [4, 5, 6]),
+    member(X, [1, 2, 3, 4]) & ~member(X, [2, 4]),
+    path(1, X),
+    path(X, 4),
+], ids=repr)
+def test_aquery_matches_query(goal):
+    base = program()
+    with base:
+        answers = [repr(r) for r in collect(aquery(goal))]
+    assert answers == [repr(r) for r in base.query(goal)]
+
+
+def test_aquery_awaits_async_functions():
+    base = program()
+    with base:
+        results = collect(aquery(scaled(X, Y)))
+        assert [(r[X], r[Y]) for r in results] == [(1, 2), (2, 4), (3, 6)]
+        assert len(collect(aquery(scaled(X, Y), limit=2))) == 2
+        with pytest.raises(Exception):
+            list(base.query(scaled(X, Y)))
+
+
+def test_aquery_times_out_on_slow_functions():
+    base = program()
+    with base:
+        with pytest.raises(QueryTimeout):
+            collect(aquery(Y == slow(1), timeout=0.1))
+
+
+def test_cancelling_stops_table_evaluation():
+    base = program()
+
+    async def consume():
+        with base:
+            async for _ in aquery(nat(N)):
+                pass
+
+    async def run():
+        task = asyncio.ensure_future(consume())
+        await asyncio.sleep(0.3)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    finished = threading.Thread(target=lambda: asyncio.run(run()))
+    finished.start()
+    finished.join(5)
+    assert not finished.is_alive()
+
+    answers = []
+    worker = threading.Thread(target=lambda: answers.extend(base.query(path(1, Y), project=Y)))
+    worker.start()
+    worker.join(5)
+    assert not worker.is_alive()
+    assert sorted(answers) == [1, 2, 3, 4]
@@ -0,0 +1,88 @@
+import pytest
+
+from LogicAPI import KnowledgeBase, Term, Var, load_facts, query, query_many, solve_batch
+
+X, Y, Z, H, T, L, R = [Var(name) for name in 'XYZHTLR']
+
+
+class app(Term):
+    pass
+
+
+class parent(Term):
+    pass
+
+
+class grandparent(Term):
+    pass
+
+
+class score(Term):
+    pass
+
+
+def program():
+    base = KnowledgeBase()
+    with base:
+        app([], L, L) <= None
+        app([H] + T, L, [H] + R) <= app(T, L, R)
+        for a, b in [('ann', 'bob'), ('ann', 'cat'), ('bob', 'dan'), ('cat', 'eve'),
+                     ('cat', 'fay')]:
+            +parent(a, b)
+        grandparent(X, Z) <= parent(X, Y) & parent(Y, Z)
+        load_facts(score, [(i % 7, i) for i in range(50)])
+    return base
+
+
+goals = [
+    app(X, Y, [1, 2, 3]),
+    app([1], [2], X),
+    parent('ann', X),
+    parent(X, X),
+    grandparent('ann', X),
+    grandparent(X, Y),
+    score(3, X),
+    score(X, 10),
+    app(X, X, [1, 1]),
+    parent(X, Y) & parent(Y, Z),
+]
+
+
+def expected(goals, **kwargs):
+    return [[repr(r) for r in query(x, **kwargs)] for x in goals]
+
+
+def batched(goals, **kwargs):
+    return [[repr(r) for r in rows] for rows in query_many(goals, **kwargs)]
+
+
+@pytest.mark.parametrize('options', [{}, {'workers': 3}, {'workers': 2, 'processes': True}],
+                         ids=['sequential', 'threads', 'processes'])
+@pytest.mark.parametrize('limit', [None, 2])
+def test_batches_match_single_queries(options, limit):
+    base = program()
+    with base:
+        assert batched(goals, limit=limit, **options) == expected(goals, limit=limit)
+        assert query_many(goals, limit=limit, project=X, **options) == \
+            [list(query(x, limit=limit, project=X)) for x in goals]
+
+
+def test_answers_are_read_through_the_rename_map():
+    base = program()
+    with base:
+        for options in [{}, {'workers': 2}]:
+            rows = query_many([parent('ann', X), parent('cat', X)], **options)
+            assert [[r[X] for r in answers] for answers in rows] == \
+                [['bob', 'cat'], ['eve', 'fay']]
+            assert query_many([grandparent(X, 'eve'), grandparent(X, 'dan')],
+                              project=X, **options) == [['ann'], ['ann']]
+        assert X.applyEnv({}) is X
+
+
+def test_solve_batch():
+    base = program()
+    rows = [('ann', X), ('bob', X), ('eve', X)]
+    with base:
+        assert solve_batch(parent, rows, project=X) == [['bob', 'cat'], ['dan'], []]
+        assert solve_batch(score, [(1, X), (2, X)], project=X, workers=2) == \
+            [list(query(score(1, X), project=X)), list(query(score(2, X), project=X))]
@@ -0,0 +1,130 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from LogicAPI import BudgetExceeded, KnowledgeBase, QueryTimeout, Term, Var, aquery
+
+N, M, X, Y, Z = Var('N'), Var('M'), Var('X'), Var('Y'), Var('Z')
+H, T, L, R = Var('H'), Var('T'), Var('L'), Var('R')
+
+
+class nat(Term):
+    tabled = True
+
+
+class path(Term):
+    tabled = True
+
+
+class edge(Term):
+    pass
+
+
+class app(Term):
+    pass
+
+
+class count(Term):
+    pass
+
+
+class fib(Term):
+    tabled = True
+
+
+def naturals():
+    base = KnowledgeBase()
+    with base:
+        +nat(0)
+        nat(N) <= nat(M) & (N == M + 1)
+        for a, b in [(1, 2), (2, 3), (3, 1)]:
+            +edge(a, b)
+        path(X, Y) <= path(X, Z) & edge(Z, Y)
+        path(X, Y) <= edge(X, Y)
+    return base
+
+
+def program():
+    base = KnowledgeBase()
+    with base:
+        app([], L, L) <= None
+        app([H] + T, L, [H] + R) <= app(T, L, R)
+        count(N, N) <= None
+        count(N, M) <= (N < 5) & count(N + 1, M)
+        +fib(0, 0)
+        +fib(1, 1)
+        fib(N, X) <= (N > 1) & fib(N - 1, Y) & fib(N - 2, Z) & (X == Y + Z)
+    return base
+
+
+def collect(results):
+    async def run():
+        return [r async for r in results]
+    return asyncio.run(run())
+
+
+def test_budgets():
+    base = program()
+    with pytest.raises(BudgetExceeded) as info:
+        list(base.query(count(0, X), max_depth=3))
+    assert info.value.reason == 'max_depth'
+    bounded = base.query(app(X, Y, [1, 2, 3]), max_steps=1000, limit=2)
+    assert len(list(bounded)) == 2
+    assert bounded.counters['steps'] > 0
+    assert list(base.query(fib(15, X), max_steps=100000, project=X)) == [610]
+
+
+def test_tabled_subgoals_count_against_max_steps():
+    base = naturals()
+    with pytest.raises(BudgetExceeded) as info:
+        list(base.query(nat(N), max_steps=5000))
+    assert info.value.reason == 'max_steps'
+    assert info.value.counters['steps'] == 5001
+
+
+def test_tabled_subgoals_time_out_and_release_the_table_space():
+    base = naturals()
+    started = time.monotonic()
+    with pytest.raises(QueryTimeout):
+        list(base.query(nat(N), timeout=0.2))
+    assert time.monotonic() - started < 5
+    answers = []
+    worker = threading.Thread(target=lambda: answers.extend(base.query(path(1, Y), project=Y)))
+    worker.start()
+    worker.join(5)
+    assert sorted(answers) == [1, 2, 3]
+
+
+def test_aquery_budgets_apply_to_tabled_subgoals():
+    base = naturals()
+    with base:
+        with pytest.raises(BudgetExceeded) as info:
+            collect(aquery(nat(N), max_steps=3000))
+    assert info.value.reason == 'max_steps'
+    with base:
+        assert sorted(r[Y] for r in collect(aquery(path(1, Y)))) == [1, 2, 3]
+
+
+def test_aquery_yields_while_filling_a_table():
+    base = naturals()
+    ticks = []
+
+    async def ticker():
+        while True:
+            ticks.append(time.monotonic())
+            await asyncio.sleep(0.01)
+
+    async def run():
+        task = asyncio.ensure_future(ticker())
+        try:
+            with base:
+                with pytest.raises(QueryTimeout):
+                    async for _ in aquery(nat(N), timeout=0.3):
+                        pass
+        finally:
+            task.cancel()
+
+    asyncio.run(run())
+    assert len(ticks) > 3
@@ -0,0 +1,52 @@
+from LogicAPI import FinalEnv, KnowledgeBase, Term, TrailEngine, Var
+
+X, Y, H, T, L, R = [Var(name) for name in 'XYHTLR']
+
+
+class square(Term):
+    pass
+
+
+class app(Term):
+    pass
+
+
+class fixed(Term):
+    pass
+
+
+def program():
+    base = KnowledgeBase()
+    with base:
+        for i in range(20):
+            +square(i, i * i)
+        app([], L, L) <= None
+        app([H] + T, L, [H] + R) <= app(T, L, R)
+        fixed(X, Y) <= square(X, Y) & square(Y, X)
+        fixed(X, Y) <= (X == Y)
+    return base
+
+
+deterministic = [square(3, X), app([1, 2, 3], [4], X), fixed(5, X), square(2, X) & app([X], [], Y)]
+
+
+def test_deterministic_calls_leave_no_choice_point():
+    base = program()
+    with base:
+        for goal in deterministic:
+            engine = TrailEngine()
+            results = engine.query(goal)
+            next(results)
+            assert engine.choices == []
+            assert list(results) == []
+            assert type(next(goal.query())) is FinalEnv
+
+
+def test_choice_points_remain_while_clauses_can_match():
+    base = program()
+    with base:
+        engine = TrailEngine()
+        results = engine.query(app(X, Y, [1, 2]))
+        next(results)
+        assert engine.choices != []
+        assert type(next(app(X, Y, [1, 2]).query())) is not FinalEnv
@@ -0,0 +1,104 @@
+import pytest
+
+from LogicAPI import KnowledgeBase, Term, Var, asserta, assertz, load_facts, retract
+
+X, Y = Var('X'), Var('Y')
+
+engines = pytest.mark.parametrize('engine', ['trail', 'env'])
+
+
+class item(Term):
+    pass
+
+
+class counter(Term):
+    pass
+
+
+class q(Term):
+    pass
+
+
+class r(Term):
+    pass
+
+
+@engines
+def test_updates_during_iteration(engine):
+    base = KnowledgeBase()
+    with base:
+        for i in range(5):
+            +item(i)
+        seen = []
+        for res in base.query(item(X), engine=engine):
+            seen.append(res[X])
+            if res[X] == 1:
+                assert retract(item(3))
+                assertz(item(99))
+                asserta(item(-1))
+        assert seen == [0, 1, 2, 3, 4]
+        assert list(base.query(item(X), engine=engine, project=X)) == [-1, 0, 1, 2, 4, 99]
+
+
+@engines
+def test_retract_all_during_iteration(engine):
+    base = KnowledgeBase()
+    with base:
+        for i in range(5):
+            +item(i)
+        seen = []
+        for res in base.query(item(X), engine=engine):
+            seen.append(res[X])
+            while retract(item(Y)):
+                pass
+        assert seen == [0, 1, 2, 3, 4]
+        assert list(base.query(item(X), engine=engine)) == []
+
+
+@engines
+def test_fact_table_updates_during_iteration(engine):
+    base = KnowledgeBase()
+    with base:
+        load_facts(counter, [(i, i * i) for i in range(10)])
+        seen = []
+        for res in base.query(counter(X, Y), engine=engine):
+            seen.append(res[X])
+            if res[X] == 0:
+                for i in range(1, 9):
+                    assert retract(counter(i, Y))
+                load_facts(counter, [(10, 100)])
+        assert seen == list(range(10))
+        assert list(base.query(counter(X, Y), engine=engine, project=X)) == [0, 9, 10]
+
+
+@engines
+def test_rule_updates_during_iteration(engine):
+    base = KnowledgeBase()
+    with base:
+        +q(1)
+        +q(2)
+        r(X) <= q(X)
+        seen = []
+        for res in base.query(r(X), engine=engine):
+            seen.append(res[X])
+            if res[X] == 1:
+                assert retract(r(Y), q(Y))
+                assertz(r(X), q(X) & (X > 1))
+        assert seen == [1, 2]
+        assert list(base.query(r(X), engine=engine, project=X)) == [2]
+
+
+@engines
+def test_retract_unifies_rule_bodies(engine):
+    base = KnowledgeBase()
+    with base:
+        for i in range(4):
+            +q(i)
+        r(X) <= q(X)
+        r(X) <= q(X) & (Y == X + 1) & (Y > 2)
+        assert not retract(r(1), q(2))
+        assert not retract(r(1), q(1) & (Y > 2))
+        assert retract(r(1), q(1))
+        assert list(base.query(r(X), engine=engine, project=X)) == [2, 3]
+        assert retract(r(Y), q(Y) & (X == Y + 1) & (X > 2))
+        assert list(base.query(r(X), engine=engine, project=X)) == []
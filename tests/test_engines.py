@@ -0,0 +1,177 @@
+import pytest
+
+from LogicAPI import Const, Cut, KnowledgeBase, Term, Var, format
+
+X, Y, Z, W, H, T, R, L, N, M = [Var(name) for name in 'XYZWHTRLNM']
+
+
+class app(Term):
+    pass
+
+
+class member(Term):
+    pass
+
+
+class rev(Term):
+    pass
+
+
+class maximum(Term):
+    pass
+
+
+class first(Term):
+    pass
+
+
+class absent(Term):
+    pass
+
+
+class same(Term):
+    pass
+
+
+class pair(Term):
+    pass
+
+
+class count(Term):
+    pass
+
+
+class between(Term):
+    def query(self):
+        low, high, x = self.args
+        for i in range(low.functor, high.functor + 1):
+            env = {}
+            if x.unifyWith(Const(i), env):
+                yield env
+
+
+class edge(Term):
+    pass
+
+
+class path(Term):
+    tabled = True
+
+
+class fib(Term):
+    tabled = True
+
+
+def program():
+    base = KnowledgeBase()
+    with base:
+        app([], L, L) <= None
+        app([H] + T, L, [H] + R) <= app(T, L, R)
+        member(X, [X] + T) <= None
+        member(X, [H] + T) <= member(X, T)
+        rev([], L, L) <= None
+        rev([H] + T, L, R) <= rev(T, [H] + L, R)
+
+        maximum(X, Y, X) <= (X >= Y) & Cut()
+        maximum(X, Y, Y) <= None
+        first(X, L) <= member(X, L) & Cut()
+        absent(X, L) <= ~member(X, L)
+        same(X, Y) <= (X == Y)
+        pair(X, Y) <= member(X, [1, 2, 3]) & between(1, X, Y) & (X != Y)
+        count(N, N) <= None
+        count(N, M) <= (N < 5) & count(N + 1, M)
+
+        for a, b in [(1, 2), (2, 3), (3, 1), (3, 4)]:
+            +edge(a, b)
+        path(X, Y) <= path(X, Z) & edge(Z, Y)
+        path(X, Y) <= edge(X, Y)
+        +fib(0, 0)
+        +fib(1, 1)
+        fib(N, X) <= (N > 1) & fib(N - 1, Y) & fib(N - 2, Z) & (X == Y + Z)
+
+    return base
+
+
+goals = [
+    app(X, Y, [1, 2, 3]),
+    app([1, 2], [3], X),
+    member(X, [1, [2, 3], 'a', None]),
+    rev([1, 2, 3, 4], [], X),
+    app(X, [3] + T, [1, 2, 3, 4]),
+    maximum(3, 5, X),
+    maximum(5, 3, X),
+    first(X, [4, 5, 6]),
+    member(X, [1, 2, 3]) & Cut() & member(Y, [X, 7]),
+    absent(4, [1, 2, 3]),
+    absent(2, [1, 2, 3]),
+    member(X, [1, 2, 3, 4]) & ~member(X, [2, 4]),
+    same(X, Y),
+    same(X, Y) & same(Y, Z),
+    same(X, [Y, Z]) & (Z == 1),
+    pair(X, Y),
+    between(1, 4, X) & (X > 2),
+    count(0, X),
+    (X == 3 * 4 + 1) & (Y == X % 5),
+    path(1, X),
+    path(X, 4),
+    fib(20, X),
+]
+
+
+def answers(base, goal, engine):
+    return [repr(result) for result in base.query(goal, engine=engine)]
+
+
+@pytest.mark.parametrize('goal', goals, ids=repr)
+def test_engines_agree(goal):
+    base = program()
+    trail = answers(base, goal, 'trail')
+    assert trail == answers(base, goal, 'env')
+
+
+def test_expected_answers():
+    base = program()
+    assert list(base.query(app(X, Y, [1, 2]), project=[X, Y])) == \
+        [([], [1, 2]), ([1], [2]), ([1, 2], [])]
+    assert list(base.query(maximum(5, 3, X), project=X)) == [5]
+    assert list(base.query(member(X, [1, 2, 3, 4]) & ~member(X, [2, 4]), project=X)) == [1, 3]
+    assert sorted(base.query(path(1, X), project=X)) == [1, 2, 3, 4]
+    assert list(base.query(fib(30, X), project=X)) == [832040]
+    assert [repr(r) for r in base.query(same(X, Y))] == ['{X = Y}']
+
+
+@pytest.mark.parametrize('engine', ['trail', 'env'])
+def test_side_effects_run_once_per_answer(engine, capsys):
+    base = program()
+    assert len(list(base.query(member(X, [1, 2]) & format('seen %s', X), engine=engine))) == 2
+    assert capsys.readouterr().out == 'seen 1\nseen 2\n'
+
+
+@pytest.mark.parametrize('engine', ['trail', 'env'])
+def test_results_outlive_backtracking(engine):
+    base = program()
+    results = list(base.query(app(X, Y, [1, 2, 3]), engine=engine))
+    assert [(r[X], r[Y]) for r in results] == \
+        [([], [1, 2, 3]), ([1], [2, 3]), ([1, 2], [3]), ([1, 2, 3], [])]
+    held = []
+    for result in base.query(app(X, [3] + T, [1, 2, 3, 3]), engine=engine):
+        held.append(result)
+    assert [(r[X], r[T]) for r in held] == [([1, 2], [3]), ([1, 2, 3], [])]
+
+
+@pytest.mark.parametrize('engine', ['trail', 'env'])
+def test_tables_follow_updates(engine):
+    base = program()
+    assert sorted(base.query(path(4, X), engine=engine, project=X)) == []
+    with base:
+        +edge(4, 1)
+    assert sorted(base.query(path(4, X), engine=engine, project=X)) == [1, 2, 3, 4]
+
+
+def test_deep_recursion_on_the_trail_engine():
+    base = KnowledgeBase()
+    with base:
+        count(N, N) <= None
+        count(N, M) <= (N < 20000) & count(N + 1, M)
+    assert list(base.query(count(0, X), limit=1, project=X)) == [0]
+    assert list(base.query(count(0, X), project=X))[-1] == 20000
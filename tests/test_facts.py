@@ -0,0 +1,27 @@
+import pytest
+
+from LogicAPI import KnowledgeBase, Term, Var, load_facts
+
+X, Y = Var('X'), Var('Y')
+
+
+class f(Term):
+    pass
+
+
+def test_csv_blank_lines_are_skipped(tmp_path):
+    path = tmp_path / 'facts.csv'
+    path.write_text('1,2\n3,4\n\n5,6\n')
+    base = KnowledgeBase()
+    with base:
+        table = load_facts(f, str(path), types=(int, int))
+    assert table is not None
+    assert list(base.query(f(X, Y), project=[X, Y])) == [(1, 2), (3, 4), (5, 6)]
+
+
+def test_rows_of_different_widths_are_rejected():
+    base = KnowledgeBase()
+    with base:
+        with pytest.raises(Exception, match='expected 2'):
+            load_facts(f, [(1, 2), (3,)])
+    assert (f, 1) not in base and (f, 2) not in base
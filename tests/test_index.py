@@ -0,0 +1,68 @@
+import pytest
+
+from LogicAPI import KnowledgeBase, Term, Var, asserta, assertz
+
+X, Y = Var('X'), Var('Y')
+
+engines = pytest.mark.parametrize('engine', ['trail', 'env'])
+
+
+class p(Term):
+    pass
+
+
+def mixed():
+    base = KnowledgeBase()
+    with base:
+        assertz(p(1, 'a'))
+        assertz(p(X, 'b'))
+        asserta(p(2, 'c'))
+        assertz(p(1, 'd'))
+        asserta(p(X, 'e'))
+        assertz(p('x', 'f'))
+        asserta(p(1, 'g'))
+        assertz(p(X, 'h'))
+        asserta(p([1], 'i'))
+    return base
+
+
+order = ['i', 'g', 'e', 'c', 'a', 'b', 'd', 'f', 'h']
+
+
+@engines
+def test_first_argument_index_keeps_clause_order(engine):
+    base = mixed()
+    assert list(base.query(p(Y, X), engine=engine, project=X)) == order
+    assert list(base.query(p(1, X), engine=engine, project=X)) == ['g', 'e', 'a', 'b', 'd', 'h']
+    assert list(base.query(p(2, X), engine=engine, project=X)) == ['e', 'c', 'b', 'h']
+    assert list(base.query(p('x', X), engine=engine, project=X)) == ['e', 'b', 'f', 'h']
+    assert list(base.query(p(3, X), engine=engine, project=X)) == ['e', 'b', 'h']
+    assert list(base.query(p([1], X), engine=engine, project=X)) == ['i', 'e', 'b', 'h']
+    procedure = base[(p, 2)]
+    assert len(procedure.candidates(p(2, X))) == 4
+    assert len(procedure.candidates(p(3, X))) == 3
+
+
+class crossing(Term):
+    pass
+
+
+@engines
+def test_on_demand_indexes_follow_updates(engine):
+    base = KnowledgeBase()
+    with base:
+        for i in range(12):
+            assertz(crossing(i, i % 3, 'move%d' % (i % 4)))
+        assert list(base.query(crossing(X, 1, 'move1'), engine=engine, project=X)) == [1]
+        procedure = base[(crossing, 3)]
+        assert {1, 2} <= set(procedure.indexes)
+        asserta(crossing(100, Y, 'move1'))
+        assertz(crossing(101, 1, X))
+        asserta(crossing(102, 1, 'move1'))
+        assertz(crossing(103, 2, 'move1'))
+        assert list(base.query(crossing(X, 1, 'move1'), engine=engine, project=X)) == \
+            [102, 100, 1, 101]
+        assert list(base.query(crossing(X, Y, 'move1'), engine=engine, project=X)) == \
+            [102, 100, 1, 5, 9, 101, 103]
+        assert len(procedure.candidates(crossing(X, 1, 'move1'))) == 7
+        assert len(procedure.candidates(crossing(X, 2, 'move0'))) == 4
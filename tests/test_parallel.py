@@ -0,0 +1,32 @@
+from LogicAPI import KnowledgeBase, Term, Var, format
+
+X, Y, H, T = Var('X'), Var('Y'), Var('H'), Var('T')
+
+
+class member(Term):
+    pass
+
+
+def lists():
+    base = KnowledgeBase()
+    with base:
+        member(X, [X] + T) <= None
+        member(X, [H] + T) <= member(X, T)
+    return base
+
+
+def test_side_effects_in_the_prefix_run_once(capfd):
+    base = lists()
+    goal = format('side effect') & member(X, [1, 2, 3, 4])
+    assert sorted(base.query(goal, workers=2, project=X)) == [1, 2, 3, 4]
+    assert capfd.readouterr().out.count('side effect') == 1
+
+
+def test_side_effects_after_a_split_run_once_per_branch(capfd):
+    base = lists()
+    goal = member(X, [1, 2]) & format('after %s\n', X) & member(Y, [1, 2, 3])
+    answers = sorted(base.query(goal, workers=2, project=[X, Y]))
+    assert answers == sorted(base.query(goal, project=[X, Y]))
+    out = capfd.readouterr().out
+    assert out.count('after 1') == 2
+    assert out.count('after 2') == 2
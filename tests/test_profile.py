@@ -0,0 +1,79 @@
+import importlib
+
+import pytest
+
+from LogicAPI import KnowledgeBase, Term, Var, profile
+
+X, Y, Z, W, H, T, R, L = [Var(name) for name in 'XYZWHTRL']
+
+
+class perm(Term):
+    pass
+
+
+class sel(Term):
+    pass
+
+
+class app(Term):
+    pass
+
+
+class p(Term):
+    pass
+
+
+class q(Term):
+    pass
+
+
+class r(Term):
+    pass
+
+
+def program():
+    base = KnowledgeBase()
+    with base:
+        perm([], []) <= None
+        perm(L, [H] + T) <= sel(H, L, R) & perm(R, T)
+        sel(X, [X] + T, T) <= None
+        sel(X, [H] + T, [H] + R) <= sel(X, T, R)
+        app([], L, L) <= None
+        app([H] + T, L, [H] + R) <= app(T, L, R)
+        +q(1)
+        +q(2)
+        +q(3)
+        +r(2)
+        +r(3)
+        p(X) <= q(X) & r(X)
+        p(X) <= q(X) & ~r(X)
+    return base
+
+
+def counts(base, goal, engine):
+    with profile() as prof:
+        answers = len(list(base.query(goal, engine=engine)))
+    return answers, sorted((row['predicate'], row['calls'], row['redos'], row['exits'],
+                            row['attempts'], row['unifications']) for row in prof.rows())
+
+
+@pytest.mark.parametrize('goal', [
+    perm([1, 2, 3], X),
+    app(X, Y, [1, 2, 3, 4]),
+    p(X),
+    perm([1, 2, 3, 4], X) & (X == [Y] + Z) & (Y > 2),
+    app(X, Y, [1, 2]) & app(Z, W, Y),
+])
+def test_engines_count_the_same_ports(goal):
+    base = program()
+    assert counts(base, goal, 'trail') == counts(base, goal, 'env')
+
+
+def test_perm_redos():
+    assert counts(program(), perm([1, 2, 3], X), 'trail')[1][0][:4] == ('perm/2', 16, 24, 24)
+
+
+@pytest.mark.parametrize('name', ['nrev', 'queens', 'zebra'])
+def test_benchmark_profiles_agree(name):
+    base, goal = importlib.import_module('benchmarks.' + name).setup()
+    assert counts(base, goal, 'trail') == counts(base, goal, 'env')
@@ -0,0 +1,74 @@
+import struct
+
+import pytest
+
+from LogicAPI import KnowledgeBase, Term, Var, load_facts, load_kb, save_kb
+
+X, Y, Z = Var('X'), Var('Y'), Var('Z')
+
+
+class edge(Term):
+    pass
+
+
+class path(Term):
+    tabled = True
+
+
+class e(Term):
+    pass
+
+
+def program():
+    base = KnowledgeBase()
+    with base:
+        for a, b in [(1, 2), (2, 3), (3, 1), (3, 4)]:
+            +edge(a, b)
+        path(X, Y) <= path(X, Z) & edge(Z, Y)
+        path(X, Y) <= edge(X, Y)
+    return base
+
+
+def answers(base, goal):
+    return [repr(result) for result in base.query(goal)]
+
+
+def body_size(snapshot):
+    with open(snapshot, 'rb') as f:
+        f.read(8)
+        return struct.unpack('<QQ', f.read(16))[0]
+
+
+@pytest.mark.parametrize('mmap', [True, False])
+def test_snapshot_round_trip(tmp_path, mmap):
+    snapshot = str(tmp_path / 'kb.snapshot')
+    base = program()
+    with base:
+        load_facts(edge, [(i, i + 1) for i in range(10, 20)])
+        +edge('a', 'b')
+        save_kb(snapshot)
+    loaded = KnowledgeBase()
+    with loaded:
+        load_kb(snapshot, mmap=mmap)
+    for goal in [edge(X, Y), path(1, X), path(X, 4), path(10, X), edge('a', X)]:
+        assert answers(loaded, goal) == answers(base, goal)
+    with loaded:
+        +edge(20, 21)
+    assert sorted(loaded.query(path(15, X), project=X)) == [16, 17, 18, 19, 20, 21]
+
+
+def test_snapshots_leave_out_lazy_indexes(tmp_path):
+    base = KnowledgeBase()
+    with base:
+        load_facts(e, [(i, i % 100) for i in range(20000)])
+        save_kb(str(tmp_path / 'before.snapshot'))
+        assert len(list(base.query(e(5, X)))) == 1
+        assert len(list(base.query(e(X, 7)))) == 200
+        assert len(list(base.query(e(5, 5)))) == 1
+        save_kb(str(tmp_path / 'after.snapshot'))
+    before = body_size(str(tmp_path / 'before.snapshot'))
+    assert body_size(str(tmp_path / 'after.snapshot')) < before + 100
+    loaded = KnowledgeBase()
+    with loaded:
+        load_kb(str(tmp_path / 'after.snapshot'))
+    assert sorted(loaded.query(e(X, 7), project=X))[:3] == [7, 107, 207]
@@ -0,0 +1,61 @@
+import random
+
+import pytest
+
+from LogicAPI import KnowledgeBase, Term, Var
+
+X, Y, Z = Var('X'), Var('Y'), Var('Z')
+
+
+class a(Term):
+    tabled = True
+
+
+class b(Term):
+    tabled = True
+
+
+class e(Term):
+    pass
+
+
+def program(maxAnswers=None):
+    base = KnowledgeBase(maxAnswers=maxAnswers)
+    rnd = random.Random(1)
+    with base:
+        for _ in range(40):
+            +e(rnd.randrange(12), rnd.randrange(12))
+        a(X, Y) <= e(X, Z) & b(Z, Y)
+        a(X, Y) <= e(X, Y)
+        b(X, Y) <= e(X, Z) & a(Z, Y)
+        b(X, Y) <= e(X, Y)
+    return base
+
+
+def answers(base, goal, engine='trail'):
+    return sorted(map(tuple, base.query(goal, engine=engine, project=[X, Y])))
+
+
+@pytest.mark.parametrize('engine', ['trail', 'env'])
+@pytest.mark.parametrize('cap', [1, 50, 200])
+def test_eviction_waits_for_the_scc(engine, cap):
+    expected = answers(program(), a(X, Y))
+    base = program(cap)
+    assert answers(base, a(X, Y), engine) == expected
+    assert answers(base, a(X, Y), engine) == expected
+    assert answers(base, b(3, Y), engine) == answers(program(), b(3, Y))
+    assert base.tables.size <= cap or len(base.tables.tables) == 1
+
+
+def test_clear_drops_only_the_named_predicate():
+    base = program()
+    expected = answers(base, a(X, Y))
+    answers(base, b(X, Y))
+    assert {key[0] for key in base.tables.tables} == {a, b}
+    base.tables.clear(a)
+    assert {key[0] for key in base.tables.tables} == {b}
+    assert base.tables.size == sum(len(t.answers) for t in base.tables.tables.values())
+    assert answers(base, a(X, Y)) == expected
+    base.tables.clear()
+    assert not base.tables.tables and base.tables.size == 0
+    assert answers(base, a(X, Y)) == expected
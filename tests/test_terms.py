@@ -0,0 +1,26 @@
+from LogicAPI import Const, KnowledgeBase, Sub, Term, Var
+
+N, X, Y, Z = Var('N'), Var('X'), Var('Y'), Var('Z')
+
+
+class fib(Term):
+    tabled = True
+
+
+def test_bound_functions_are_copied_before_evaluation():
+    func = Sub(N, 1).applyEnv({N.id: Const(20)})
+    assert not func.ground
+    copy = func.applyEnv({})
+    assert copy is not func
+    assert copy.eval() == 19
+    assert [arg.functor for arg in func.args] == [20, 1]
+
+
+def test_tabled_calls_with_arithmetic_arguments():
+    base = KnowledgeBase()
+    with base:
+        +fib(0, 0)
+        +fib(1, 1)
+        fib(N, X) <= (N > 1) & fib(N - 1, Y) & fib(N - 2, Z) & (X == Y + Z)
+    assert list(base.query(fib(25, X), project=X)) == [75025]
+    assert list(base.query(fib(25, X), engine='env', project=X)) == [75025]
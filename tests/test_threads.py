@@ -0,0 +1,88 @@
+import sys
+import threading
+
+import pytest
+
+from LogicAPI import KnowledgeBase, Term, Var, load_facts
+
+X, Y, Z, H, T, L, R = [Var(name) for name in 'XYZHTLR']
+
+
+class app(Term):
+    pass
+
+
+class link(Term):
+    pass
+
+
+class score(Term):
+    pass
+
+
+class edge(Term):
+    pass
+
+
+class path(Term):
+    tabled = True
+
+
+def program():
+    base = KnowledgeBase()
+    with base:
+        app([], L, L) <= None
+        app([H] + T, L, [H] + R) <= app(T, L, R)
+        for i in range(40):
+            +link(i, i % 5)
+        load_facts(score, [(i % 11, i) for i in range(300)])
+        for i in range(30):
+            +edge(i, (i * 7 + 3) % 30)
+            +edge(i, (i + 1) % 30)
+        path(X, Y) <= path(X, Z) & edge(Z, Y)
+        path(X, Y) <= edge(X, Y)
+    return base
+
+
+goals = [
+    link(X, 3),
+    score(X, 150),
+    score(4, X),
+    score(4, 15),
+    path(5, X),
+    path(X, 12),
+    app(X, Y, [1, 2, 3, 4]),
+    link(X, Y) & score(Y, Z),
+]
+
+
+def answers(base, engine):
+    return [sorted(repr(r) for r in base.query(goal, engine=engine)) for goal in goals]
+
+
+@pytest.fixture
+def switching():
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(interval)
+
+
+@pytest.mark.parametrize('engine', ['trail', 'env'])
+def test_threads_share_a_cold_knowledge_base(engine, switching):
+    expected = answers(program(), engine)
+    for _ in range(3):
+        base = program()
+        start = threading.Barrier(6)
+        results = [None] * 6
+
+        def worker(n):
+            start.wait()
+            results[n] = answers(base, engine)
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(60)
+        assert results == [expected] * 6
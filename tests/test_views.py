@@ -0,0 +1,133 @@
+import random
+
+import pytest
+
+from LogicAPI import KnowledgeBase, Term, Var, load_facts, materialize, retract
+
+X, Y, Z = Var('X'), Var('Y'), Var('Z')
+
+
+class edge(Term):
+    pass
+
+
+class hub(Term):
+    pass
+
+
+class node(Term):
+    pass
+
+
+class path(Term):
+    pass
+
+
+class tri(Term):
+    pass
+
+
+class big(Term):
+    pass
+
+
+class reach(Term):
+    pass
+
+
+class unreach(Term):
+    pass
+
+
+def rules():
+    path(X, Y) <= edge(X, Y)
+    path(X, Y) <= path(X, Z) & edge(Z, Y)
+    tri(X) <= path(X, X) & ~hub(X)
+    big(X) <= tri(X) & (X > 10)
+
+
+def contents(base):
+    return (set(map(tuple, base.query(path(X, Y), project=[X, Y]))),
+            set(base.query(tri(X), project=X)),
+            set(base.query(big(X), project=X)))
+
+
+def recompute(edges, hubs):
+    base = KnowledgeBase()
+    with base:
+        load_facts(edge, edges)
+        +hub(-1)
+        for h in hubs:
+            +hub(h)
+        rules()
+        materialize(path, tri, big)
+    return contents(base)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_view_matches_recomputation(seed):
+    rand = random.Random(seed)
+    n = 14
+    edges = [(rand.randrange(n), rand.randrange(n)) for _ in range(18)]
+    hubs = [3]
+    live = KnowledgeBase()
+    with live:
+        load_facts(edge, edges)
+        +hub(-1)
+        +hub(3)
+        rules()
+        materialize(path, tri)
+        materialize(big)
+    for _ in range(150):
+        with live:
+            r = rand.random()
+            if r < 0.05:
+                h = rand.randrange(n)
+                +hub(h)
+                hubs.append(h)
+            elif r < 0.1 and hubs:
+                h = rand.choice(hubs)
+                hubs.remove(h)
+                assert retract(hub(h))
+            elif r < 0.55 and edges:
+                e = rand.choice(edges)
+                edges.remove(e)
+                assert retract(edge(*e))
+            else:
+                e = (rand.randrange(n), rand.randrange(n))
+                edges.append(e)
+                if rand.random() < 0.5:
+                    +edge(*e)
+                else:
+                    load_facts(edge, [e])
+        assert contents(live) == recompute(edges, hubs)
+
+
+def test_negated_recursive_dependency():
+    base = KnowledgeBase()
+    with base:
+        for i in range(4):
+            +node(i)
+        +edge(0, 1)
+        +edge(1, 0)
+        +edge(2, 3)
+        reach(X, Y) <= edge(X, Y)
+        reach(X, Y) <= edge(X, Z) & reach(Z, Y)
+        unreach(X, Y) <= node(X) & node(Y) & ~reach(X, Y)
+        materialize(reach, unreach)
+        assert set(base.query(unreach(0, Y), project=Y)) == {2, 3}
+        +edge(1, 2)
+        assert set(base.query(unreach(0, Y), project=Y)) == set()
+        assert len(list(base.query(unreach(X, Y)))) == 7
+        assert retract(edge(1, 2))
+        assert set(base.query(unreach(0, Y), project=Y)) == {2, 3}
+
+
+def test_negation_through_recursion_is_rejected():
+    base = KnowledgeBase()
+    with base:
+        +node(1)
+        tri(X) <= node(X) & ~big(X)
+        big(X) <= node(X) & ~tri(X)
+        with pytest.raises(Exception, match='depends on it'):
+            materialize(tri)